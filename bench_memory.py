@@ -0,0 +1,85 @@
+"""联系人内存占用基准测试
+
+用法: python bench_memory.py [联系人数量]
+
+使用tracemalloc分别测量联系人对象和搜索缓存条目平均每个联系人占用的字节数，
+对比当前的紧凑表示（__slots__联系人、元组缓存条目）与原先的表示（带实例字典的联系人、
+字典缓存条目）。
+"""
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+from typing import Callable, List, Tuple
+from contact import Contact
+from contact_manager import ContactManager
+from storage import DataStorage
+
+class DictContact:
+    """带实例字典的联系人，模拟改用__slots__之前的内存布局
+
+    不继承Contact（否则各字段仍存放在槽中，不会创建实例字典），字段与Contact完全相同，
+    值取自同样参数创建的Contact，两种表示保存的数据一致。
+    """
+
+    def __init__(self, name: str, phone: str, email: str = ""):
+        contact = Contact(name, phone, email)
+        for field in Contact.__slots__:
+            setattr(self, field, getattr(contact, field))
+
+SYLLABLES = ['li', 'wang', 'zhang', 'liu', 'chen', 'yang', 'zhao', 'huang', 'zhou', 'wu',
+             'ann', 'bob', 'emma', 'james', 'olivia', 'noah', 'mia', 'lucas', 'sophia', 'ethan']
+DOMAINS = ['qq.com', '163.com', 'gmail.com', 'outlook.com', 'example.com']
+PREFIXES = ['+86', '+1', '+44', '+852', '']
+
+def make_rows(count: int) -> List[Tuple[str, str, str]]:
+    """生成固定随机种子的联系人数据"""
+    rng = random.Random(42)
+    rows = []
+    for i in range(count):
+        name = f"{rng.choice(SYLLABLES).title()} {rng.choice(SYLLABLES).title()}"
+        prefix = rng.choice(PREFIXES)
+        phone = f"{prefix}138{i:08d}" if prefix in ('+86', '') else f"{prefix}{5550000000 + i}"
+        email = f"{name.split()[0].lower()}{i}@{rng.choice(DOMAINS)}" if rng.random() < 0.7 else ""
+        rows.append((name, phone, email))
+    return rows
+
+def measure(build: Callable[[], object]) -> int:
+    """返回build创建的对象占用的字节数"""
+    tracemalloc.start()
+    tracemalloc.clear_traces()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rows = make_rows(count)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        manager = ContactManager(DataStorage(os.path.join(temp_dir, "contacts.json")))
+
+        def build_entries(contact_class, compact):
+            contacts = [contact_class(name, phone, email) for name, phone, email in rows]
+            entries = [manager._make_cache_entry(contact, order) for order, contact in enumerate(contacts)]
+            if not compact:
+                entries = [entry._asdict() for entry in entries]
+            return contacts, entries
+
+        results = {}
+        for label, contact_class, compact in (("before", DictContact, False), ("after", Contact, True)):
+            contacts_size = measure(lambda: [contact_class(name, phone, email) for name, phone, email in rows])
+            total_size = measure(lambda: build_entries(contact_class, compact))
+            results[label] = (contacts_size / count, (total_size - contacts_size) / count, total_size / count)
+
+    print(f"{count} contacts, bytes per contact")
+    print(f"{'':8}{'contact':>10}{'cache':>10}{'total':>10}")
+    for label, (contact_bytes, cache_bytes, total_bytes) in results.items():
+        print(f"{label:8}{contact_bytes:10.0f}{cache_bytes:10.0f}{total_bytes:10.0f}")
+    saved = 1 - results["after"][2] / results["before"][2]
+    print(f"saved {saved:.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
-from typing import Dict, Set, List, Optional, Any
+import uuid
+from typing import Dict, Set, List, Optional, Any, Tuple
 from validator import Validator
 
 # 国家区号映射
@@ -31,6 +32,25 @@ COUNTRY_CODES: Dict[str, str] = {
     '+853': '中国澳门'
 }
 
+# 国家区号的前缀树：每个节点为 字符 -> 子节点，节点中键为None的项保存以该节点结尾的区号
+_DIALING_CODE_TRIE: Dict[Optional[str], Any] = {}
+for code in COUNTRY_CODES:
+    node = _DIALING_CODE_TRIE
+    for char in code:
+        node = node.setdefault(char, {})
+    node[None] = code
+
+def match_dialing_code(phone: str) -> Optional[str]:
+    """返回电话号码开头最长的国家区号，没有匹配的区号时返回None"""
+    node = _DIALING_CODE_TRIE
+    matched = None
+    for char in phone:
+        node = node.get(char)
+        if node is None:
+            break
+        matched = node.get(None, matched)
+    return matched
+
 # 九键键盘映射表
 # 数字键对应字母，用于九键搜索
 KEYPAD_MAPPING: Dict[str, Set[str]] = {
@@ -50,53 +70,78 @@ for key, letters in KEYPAD_MAPPING.items():
     for letter in letters:
         LETTER_TO_KEY[letter] = key
 
+def generate_contact_id() -> str:
+    """生成新的联系人唯一标识"""
+    return uuid.uuid4().hex
+
 class Contact:
-    def __init__(self, name: str, phone: str, email: str = "", remark: str = "", is_frequent: bool = False):
+    # 不使用实例字典，大量联系人时显著减少内存
+    __slots__ = ('id', 'name', 'phone', 'email', 'remark', 'is_frequent', 'country', '_formatted_phone')
+
+    def __init__(self, name: str, phone: str, email: str = "", remark: str = "", is_frequent: bool = False,
+                 contact_id: Optional[str] = None):
         # 验证输入数据
         valid, msg = Validator.validate_contact_data(name, phone, email, remark)
         if not valid:
             raise ValueError(f"Invalid contact data: {msg}")
+        if contact_id is not None and (not isinstance(contact_id, str) or not contact_id):
+            raise ValueError("Invalid contact data: contact_id must be a non-empty string")
         
+        # 持久化的唯一标识，不随列表位置或电话号码变化
+        self.id: str = contact_id if contact_id is not None else generate_contact_id()
         self.name: str = name.strip()
         self.phone: str = phone.strip()
         self.email: str = email.strip()
         self.remark: str = remark.strip()
         self.is_frequent: bool = is_frequent
         self.country: str = self.get_country_from_phone()
+        # 格式化电话号码的缓存：(格式化时的号码, 格式化结果)，号码变化后自动失效
+        self._formatted_phone: Optional[Tuple[str, str]] = None
 
     def get_country_from_phone(self) -> str:
         """根据电话号码获取国家/地区"""
         if not self.phone:
             return '未知'
         
-        for code, country in COUNTRY_CODES.items():
-            if self.phone.startswith(code):
-                return country
+        code = match_dialing_code(self.phone)
+        if code is not None:
+            return COUNTRY_CODES[code]
         # 检查是否是国内号码（无前缀）
         if self.phone.isdigit() and len(self.phone) == 11:
             return '中国'
         return '未知'
     
     def format_phone(self) -> str:
-        """格式化电话号码显示，在区号和电话号中间添加空格"""
-        if not self.phone:
+        """格式化电话号码显示，在区号和电话号中间添加空格（结果缓存到号码变化为止）"""
+        cached = self._formatted_phone
+        if cached is not None and cached[0] == self.phone:
+            return cached[1]
+        formatted = self._format_phone(self.phone)
+        self._formatted_phone = (self.phone, formatted)
+        return formatted
+
+    @staticmethod
+    def _format_phone(phone: str) -> str:
+        """格式化电话号码"""
+        if not phone:
             return ""
         
-        # 检查是否有国际区号
-        for code in COUNTRY_CODES.keys():
-            if self.phone.startswith(code):
-                # 有国际区号，在区号后添加空格
-                return f"{code} {self.phone[len(code):]}"
+        # 检查是否有国际区号，按最长的区号匹配
+        code = match_dialing_code(phone)
+        if code is not None:
+            # 有国际区号，在区号后添加空格
+            return f"{code} {phone[len(code):]}"
         # 检查是否是国内11位手机号（无前缀）
-        if self.phone.isdigit() and len(self.phone) == 11:
+        if phone.isdigit() and len(phone) == 11:
             # 国内手机号，添加+86前缀和空格
-            return f"+86 {self.phone}"
+            return f"+86 {phone}"
         # 其他情况，保持原样
-        return self.phone
+        return phone
 
     def to_dict(self) -> Dict[str, Any]:
         """将联系人转换为字典"""
         return {
+            "id": self.id,
             "name": self.name,
             "phone": self.phone,
             "email": self.email,
@@ -130,14 +175,33 @@ class Contact:
         if not isinstance(is_frequent, bool):
             raise TypeError("is_frequent must be a boolean")
         
-        contact = cls(
+        # 旧数据没有id字段，加载时生成新的标识
+        contact_id = data.get("id")
+        if contact_id is not None and not isinstance(contact_id, str):
+            raise TypeError("id must be a string")
+        
+        # 构造函数中已计算国家/地区
+        return cls(
             data["name"],
             data["phone"],
             email,
             remark,
-            is_frequent
+            is_frequent,
+            contact_id
         )
+    
+    @classmethod
+    def from_trusted_dict(cls, data: Dict[str, Any]) -> 'Contact':
+        """从本程序保存且校验和一致的数据创建联系人，跳过类型检查和数据校验"""
+        contact = cls.__new__(cls)
+        contact.id = data.get("id") or generate_contact_id()
+        contact.name = data["name"]
+        contact.phone = data["phone"]
+        contact.email = data.get("email", "")
+        contact.remark = data.get("remark", "")
+        contact.is_frequent = data.get("is_frequent", False)
         contact.country = contact.get_country_from_phone()
+        contact._formatted_phone = None
         return contact
     
     def update(self, name: Optional[str] = None, phone: Optional[str] = None, 
@@ -1,71 +1,472 @@
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator, Set, Callable
+from collections import OrderedDict
+from contextlib import contextmanager
+import heapq
+import sys
+from bisect import bisect_left
 import logging
+from operator import itemgetter
 from contact import LETTER_TO_KEY
-from contact import Contact
+from contact import Contact, generate_contact_id
+from contacts_view import ContactsView
+from search_index import NGramIndex, KeypadIndex, FuzzyIndex, SearchEntry, match_rank, MATCH_EXACT, MATCH_PREFIX, MATCH_WORD_START
+from pinyin_table import hanzi_to_pinyin
+from query import IndexAccess, Predicate, QueryPlan, parse_query, plan_query
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 批量修改涉及的联系人超过现有数量的该比例时，直接全量重建索引，比逐个增量更新更快
+BULK_REINDEX_RATIO = 0.25
+
 class ContactManager:
-    def __init__(self, storage):
-        """初始化联系人管理器"""
+    def __init__(self, storage, use_ngram_index: bool = True, fuzzy_max_distance: int = 2,
+                 query_cache_size: int = 128):
+        """初始化联系人管理器
+
+        use_ngram_index 为 True 时为小写名称维护n-gram倒排索引，姓名子串搜索先求候选集再校验，
+        不再逐个扫描所有联系人。fuzzy_max_distance 为模糊搜索支持的最大编辑距离。
+        query_cache_size 为查询结果LRU缓存的容量，为0时不缓存。
+        """
         if storage is None:
             raise ValueError("storage cannot be None")
         if not hasattr(storage, 'contacts') or not hasattr(storage, 'save_contacts'):
             raise TypeError("storage must have contacts attribute and save_contacts method")
+        for method in ('add_contact', 'update_contact', 'delete_contact', 'get_contact_by_phone'):
+            if not callable(getattr(storage, method, None)):
+                raise TypeError(f"storage must have {method} method")
+        if not isinstance(query_cache_size, int) or query_cache_size < 0:
+            raise ValueError("query_cache_size must be a non-negative integer")
         
         self.storage = storage
+        # 联系人id到联系人对象的映射，界面通过id定位联系人
+        self._contacts_by_id: Dict[str, Contact] = {}
+        self._rebuild_id_index()
         # 预计算并缓存搜索所需的小写名称，提高搜索效率
-        self._search_cache: List[Dict[str, Any]] = []
+        # 以联系人id为键，保持与存储列表相同的顺序，增删改时只更新受影响的条目
+        self._search_cache: Dict[str, SearchEntry] = {}
+        # 全量重建搜索缓存的次数
+        self.cache_rebuild_count: int = 0
+        # 缓存条目的插入序号，用于让索引查询结果保持存储顺序
+        self._next_order: int = 0
+        # 现有缓存条目的序号（有序）；联系人在存储列表中的位置即其序号在此列表中的位置
+        self._orders: List[int] = []
+        self._name_index: Optional[NGramIndex] = NGramIndex() if use_ngram_index else None
+        # 词首九键数字序列的有序索引
+        self._keypad_index: KeypadIndex = KeypadIndex()
+        # 姓名中各个词的编辑距离索引，首次模糊搜索时才建立
+        self._fuzzy_max_distance: int = fuzzy_max_distance
+        self._fuzzy_index: Optional[FuzzyIndex] = None
+        # 分面二级索引：国家/地区 -> 联系人id，邮箱域名 -> 联系人id
+        self._country_index: Dict[str, Set[str]] = {}
+        self._email_domain_index: Dict[str, Set[str]] = {}
+        # 按存储顺序维护的常用联系人视图，同时作为常用标记的索引
+        self.frequent_view: FrequentContactsView = FrequentContactsView()
+        # 联系人变化事件的订阅者，以 (事件, 联系人id) 调用
+        self._listeners: List[Callable[[str, Optional[str]], None]] = []
+        # 进行中的事务层数
+        self._transaction_depth: int = 0
+        # 搜索缓存每次变化时递增，九键搜索会话和查询结果缓存据此判断缓存是否失效
+        self._generation: int = 0
+        # 索引最近一次与存储同步时存储层的修改代数，存储层不提供代数时为None
+        self._storage_generation: Optional[int] = None
+        # 查询 -> (生成时的 (缓存代数, 存储代数), 结果联系人id列表)，按最近使用顺序排列
+        self._query_cache: 'OrderedDict[Tuple, Tuple[Tuple[int, Optional[int]], List[str]]]' = OrderedDict()
+        self._query_cache_size: int = query_cache_size
+        self._query_cache_hits: int = 0
+        self._query_cache_misses: int = 0
+        # 查询规划器可用的二级索引
+        self._query_indexes: List[IndexAccess] = []
+        self._register_query_indexes()
         self._precompute_search_cache()
 
+    def _register_query_indexes(self) -> None:
+        """登记结构化查询可以使用的索引"""
+        def phone_lookup(predicate: Predicate) -> Set[str]:
+            contact = self.storage.get_contact_by_phone(predicate.value)
+            return {contact.id} if contact is not None and contact.id in self._search_cache else set()
+        
+        self._query_indexes.append(IndexAccess(
+            'phone',
+            lambda predicate: predicate.field == 'phone' and predicate.exact,
+            lambda predicate: len(phone_lookup(predicate)),
+            phone_lookup
+        ))
+        if self._name_index is not None:
+            name_index = self._name_index
+            self._query_indexes.append(IndexAccess(
+                'name_ngram',
+                lambda predicate: predicate.field == 'name' and name_index.estimate(predicate.value) is not None,
+                lambda predicate: name_index.estimate(predicate.value),
+                lambda predicate: name_index.candidates(predicate.value),
+                exact=False
+            ))
+        self._query_indexes.append(IndexAccess(
+            'country',
+            lambda predicate: predicate.field == 'country',
+            lambda predicate: len(self._country_index.get(predicate.value, ())),
+            lambda predicate: self._country_index.get(predicate.value, set())
+        ))
+        self._query_indexes.append(IndexAccess(
+            'email_domain',
+            lambda predicate: predicate.field == 'email' and not predicate.exact and predicate.value.startswith('@'),
+            lambda predicate: sum(len(self._email_domain_index[domain]) for domain in self._matching_domains(predicate.value)),
+            lambda predicate: self._keys_for_domains(self._matching_domains(predicate.value)),
+            exact=False
+        ))
+        self._query_indexes.append(IndexAccess(
+            'frequent',
+            lambda predicate: predicate.field == 'frequent',
+            lambda predicate: (len(self.frequent_view) if predicate.value
+                               else len(self._search_cache) - len(self.frequent_view)),
+            lambda predicate: (self.frequent_view.members if predicate.value
+                               else self._search_cache.keys() - self.frequent_view.members)
+        ))
+        self._query_indexes.append(IndexAccess(
+            'keypad',
+            lambda predicate: predicate.field == 'keypad',
+            lambda predicate: self._keypad_index.count_prefix(predicate.value),
+            lambda predicate: self._keypad_index.keys_in_range(*self._keypad_index.prefix_range(predicate.value))
+        ))
+    
+    def _rebuild_id_index(self) -> None:
+        """根据存储中的联系人重建id索引"""
+        self._contacts_by_id = {contact.id: contact for contact in self.storage.contacts}
+
     def _precompute_search_cache(self) -> None:
-        """预计算搜索缓存，提高搜索效率"""
+        """预计算搜索缓存，提高搜索效率（全量重建，仅在加载或显式重建索引时使用）"""
         self._search_cache.clear()
+        self._next_order = 0
         
+        self._country_index.clear()
+        self._email_domain_index.clear()
         for contact in self.storage.contacts:
-            name_lower = contact.name.lower()
-            self._search_cache.append({
-                'contact': contact,
-                'name_lower': name_lower,
-                'phone': contact.phone,
-                'keypad_code': self.convert_to_keypad_code(name_lower)
-            })
+            item = self._make_cache_entry(contact, self._next_order)
+            self._search_cache[contact.id] = item
+            self._add_facets(contact.id, item)
+            self._next_order += 1
+        self._orders = list(range(self._next_order))
+        
+        if self._name_index is not None:
+            self._name_index.rebuild(
+                (contact_id, item.name_lower) for contact_id, item in self._search_cache.items()
+            )
+        self._keypad_index.rebuild(
+            (contact_id, item.keypad_sequences) for contact_id, item in self._search_cache.items()
+        )
+        # 模糊索引在下次模糊搜索时按需重建
+        self._fuzzy_index = None
+        self.frequent_view.rebuild(
+            (item.order, contact_id) for contact_id, item in self._search_cache.items() if item.is_frequent
+        )
+        
+        self._generation += 1
+        self._storage_generation = self._store_generation()
+        self.cache_rebuild_count += 1
+        logger.info(f"Search cache rebuilt with {len(self._search_cache)} contacts")
+        self._notify('reset', None)
+    
+    def _make_cache_entry(self, contact: Contact, order: int) -> SearchEntry:
+        """生成单个联系人的搜索缓存条目"""
+        name_lower = contact.name.lower()
+        email_lower = contact.email.lower()
+        word_codes = self._keypad_word_codes(name_lower)
+        # 邮箱域名大量重复，驻留后所有条目共享同一个字符串对象
+        email_domain = sys.intern(email_lower.rpartition('@')[2]) if '@' in email_lower else ''
+        return SearchEntry(
+            contact, name_lower, contact.phone, email_lower, email_domain, contact.country, contact.is_frequent,
+            ''.join(word_codes), ''.join(code[0] for code in word_codes), self._keypad_sequences(word_codes), order
+        )
+    
+    @staticmethod
+    def _keypad_word_codes(text: str) -> List[str]:
+        """将文本切分为词并转换为九键数字序列
+
+        连续的拉丁字母为一个词，每个汉字按拼音为一个词（首字按姓氏读音），
+        空格、标点等无法映射到按键的字符视为词间分隔。
+        """
+        word_codes = []
+        current = []
+        for position, char in enumerate(text):
+            key = LETTER_TO_KEY.get(char)
+            if key:
+                current.append(key)
+                continue
+            if current:
+                word_codes.append(''.join(current))
+                current = []
+            pinyin = hanzi_to_pinyin(char, surname=position == 0)
+            if pinyin:
+                word_codes.append(''.join(LETTER_TO_KEY[letter] for letter in pinyin))
+        if current:
+            word_codes.append(''.join(current))
+        return word_codes
+    
+    @staticmethod
+    def _keypad_sequences(word_codes: List[str]) -> Tuple[str, ...]:
+        """计算从每个词首开始到名称末尾的全拼和首字母九键序列（去重）"""
+        full_code = ''.join(word_codes)
+        initials = ''.join(code[0] for code in word_codes)
+        sequences = []
+        start = 0
+        for position, code in enumerate(word_codes):
+            sequences.append(full_code[start:])
+            sequences.append(initials[position:])
+            start += len(code)
+        return tuple(dict.fromkeys(sequences))
+    
+    @staticmethod
+    def _index_add(index: Dict[str, Set[str]], value: str, key: str) -> None:
+        """向 值 -> id集合 形式的索引中加入一项"""
+        index.setdefault(value, set()).add(key)
+    
+    @staticmethod
+    def _index_discard(index: Dict[str, Set[str]], value: str, key: str) -> None:
+        """从 值 -> id集合 形式的索引中移除一项，集合为空时删除该值"""
+        keys = index.get(value)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del index[value]
+    
+    def _add_facets(self, key: str, item: SearchEntry) -> None:
+        """将缓存条目加入国家和邮箱域名索引"""
+        self._index_add(self._country_index, item.country, key)
+        if item.email_domain:
+            self._index_add(self._email_domain_index, item.email_domain, key)
+    
+    def _remove_facets(self, key: str, item: SearchEntry) -> None:
+        """将缓存条目移出国家和邮箱域名索引"""
+        self._index_discard(self._country_index, item.country, key)
+        if item.email_domain:
+            self._index_discard(self._email_domain_index, item.email_domain, key)
+    
+    def _matching_domains(self, email_query: str) -> List[str]:
+        """以@开头的邮箱查询可能匹配的域名：邮箱只含一个@，查询命中当且仅当域名以@之后的部分开头"""
+        prefix = email_query[1:]
+        if '@' in prefix:
+            return []
+        return [domain for domain in self._email_domain_index if domain.startswith(prefix)]
+    
+    def _keys_for_domains(self, domains: List[str]) -> Set[str]:
+        """合并多个域名下的联系人id"""
+        if len(domains) == 1:
+            return self._email_domain_index[domains[0]]
+        keys: Set[str] = set()
+        for domain in domains:
+            keys |= self._email_domain_index[domain]
+        return keys
+    
+    def _update_cache_entry(self, contact: Contact) -> None:
+        """新增或替换单个联系人的缓存条目，已有条目保持原有位置"""
+        old_item = self._search_cache.get(contact.id)
+        if old_item is None:
+            order = self._next_order
+            self._next_order += 1
+            # 新联系人追加在存储列表末尾，序号也最大
+            self._orders.append(order)
+        else:
+            order = old_item.order
+            if self._name_index is not None:
+                self._name_index.remove(contact.id, old_item.name_lower)
+            self._keypad_index.remove(contact.id, old_item.keypad_sequences)
+            if self._fuzzy_index is not None:
+                self._fuzzy_index.remove(contact.id, old_item.name_lower)
+            self._remove_facets(contact.id, old_item)
+        
+        item = self._make_cache_entry(contact, order)
+        self._search_cache[contact.id] = item
+        self._add_facets(contact.id, item)
+        if self._name_index is not None:
+            self._name_index.add(contact.id, item.name_lower)
+        self._keypad_index.add(contact.id, item.keypad_sequences)
+        if self._fuzzy_index is not None:
+            self._fuzzy_index.add(contact.id, item.name_lower)
+        self._generation += 1
+        self._storage_generation = self._store_generation()
+        self.frequent_view.apply(contact.id, order, old_item is not None and old_item.is_frequent,
+                                 item.is_frequent)
+        self._notify('added' if old_item is None else 'updated', contact.id)
+    
+    def _remove_cache_entry(self, contact: Contact) -> None:
+        """删除单个联系人的缓存条目"""
+        old_item = self._search_cache.pop(contact.id, None)
+        if old_item is None:
+            return
+        del self._orders[bisect_left(self._orders, old_item.order)]
+        if self._name_index is not None:
+            self._name_index.remove(contact.id, old_item.name_lower)
+        self._keypad_index.remove(contact.id, old_item.keypad_sequences)
+        if self._fuzzy_index is not None:
+            self._fuzzy_index.remove(contact.id, old_item.name_lower)
+        self._remove_facets(contact.id, old_item)
+        self._generation += 1
+        self._storage_generation = self._store_generation()
+        self.frequent_view.apply(contact.id, old_item.order, old_item.is_frequent, False)
+        self._notify('removed', contact.id)
+    
+    def subscribe(self, listener: Callable[[str, Optional[str]], None]) -> None:
+        """订阅联系人变化事件
+
+        每次新增、修改、删除联系人后以 (事件, 联系人id) 调用listener，事件为added、updated、
+        removed；全量重建缓存后以 ('reset', None) 调用，订阅者应重新读取全部数据。
+        """
+        self._listeners.append(listener)
+    
+    def unsubscribe(self, listener: Callable[[str, Optional[str]], None]) -> None:
+        """取消订阅联系人变化事件"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+    
+    def _notify(self, event: str, contact_id: Optional[str]) -> None:
+        """通知订阅者，单个订阅者出错不影响其他订阅者和数据更新"""
+        for listener in list(self._listeners):
+            try:
+                listener(event, contact_id)
+            except Exception as e:
+                logger.error(f"Contact listener failed on {event} {contact_id}: {e}", exc_info=True)
+    
+    def _store_generation(self) -> Optional[int]:
+        """存储层的修改代数，存储层不提供时返回None"""
+        return getattr(self.storage, 'generation', None)
+    
+    def _sync_with_storage(self) -> None:
+        """存储层被绕过管理器直接修改（例如clear_contacts）后，按存储内容重建索引
+
+        查询和每次修改前都需调用：修改会记录存储层的最新代数，之前的外部修改将无法再被发现。
+        """
+        generation = self._store_generation()
+        if generation is not None and generation != self._storage_generation:
+            logger.info("Storage changed outside the manager, rebuilding indexes")
+            self.reindex()
+    
+    def _storage_write_failed(self) -> None:
+        """存储层单次写入失败后调用
+
+        存储层写入失败时已撤销内存中的修改，联系人与修改前完全一致，索引无需重建；
+        只记录撤销后存储层的代数，避免下次查询误判为外部修改而全量重建。
+        """
+        self._storage_generation = self._store_generation()
+    
+    def _cached_query(self, key: Tuple, compute: Callable[[], List[Contact]]) -> List[Contact]:
+        """通过查询结果缓存执行查询
+
+        缓存条目记录生成时的缓存代数和存储层代数，任一变化（包括绕过管理器直接修改存储）后失效；
+        命中时按id还原联系人，未命中时执行compute并缓存。
+        """
+        self._sync_with_storage()
+        stamp = (self._generation, self._store_generation())
+        entry = self._query_cache.get(key)
+        if entry is not None and entry[0] == stamp:
+            self._query_cache.move_to_end(key)
+            self._query_cache_hits += 1
+            return [self._contacts_by_id[contact_id] for contact_id in entry[1]]
         
-        logger.info(f"Search cache updated with {len(self._search_cache)} contacts")
+        self._query_cache_misses += 1
+        results = compute()
+        if self._query_cache_size > 0:
+            self._query_cache[key] = (stamp, [contact.id for contact in results])
+            self._query_cache.move_to_end(key)
+            while len(self._query_cache) > self._query_cache_size:
+                self._query_cache.popitem(last=False)
+        return results
+    
+    def get_query_cache_stats(self) -> Dict[str, int]:
+        """获取查询结果缓存的命中统计"""
+        return {
+            'hits': self._query_cache_hits,
+            'misses': self._query_cache_misses,
+            'size': len(self._query_cache),
+            'capacity': self._query_cache_size
+        }
+    
+    def clear_query_cache(self) -> None:
+        """清空查询结果缓存和统计"""
+        self._query_cache.clear()
+        self._query_cache_hits = 0
+        self._query_cache_misses = 0
+    
+    @staticmethod
+    def _score(rank: int, item: SearchEntry) -> Tuple[int, bool, int]:
+        """计算排序键：先按匹配程度，同等程度下常用联系人优先，最后按存储顺序"""
+        return (rank, not item.contact.is_frequent, item.order)
+    
+    @staticmethod
+    def _top_k(scored: Iterable[Tuple[Tuple[int, bool, int], Contact]],
+               limit: Optional[int], offset: int) -> List[Contact]:
+        """按排序键返回从offset开始的至多limit个联系人，limit为None时返回全部
+
+        指定limit时用堆只保留前offset + limit个结果，宽泛的查询无需对全部命中排序。
+        """
+        if limit is not None and (not isinstance(limit, int) or limit < 0):
+            raise ValueError("limit must be a non-negative integer or None")
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError("offset must be a non-negative integer")
+        
+        if limit is None:
+            selected = sorted(scored, key=itemgetter(0))
+        else:
+            selected = heapq.nsmallest(offset + limit, scored, key=itemgetter(0))
+        return [contact for _, contact in selected[offset:]]
+    
+    @staticmethod
+    def _keypad_rank(item: SearchEntry, keypad_code: str) -> int:
+        """九键序列的匹配程度：与全拼或首字母相同、为其前缀，否则为词首匹配"""
+        if keypad_code == item.keypad_code or keypad_code == item.keypad_initials:
+            return MATCH_EXACT
+        if item.keypad_code.startswith(keypad_code) or item.keypad_initials.startswith(keypad_code):
+            return MATCH_PREFIX
+        return MATCH_WORD_START
+    
+    def _rank_keypad_keys(self, keys: Set[str], keypad_code: str,
+                          limit: Optional[int] = None, offset: int = 0) -> List[Contact]:
+        """对九键索引命中的联系人按相关度排序分页"""
+        cache = self._search_cache
+        return self._top_k(
+            ((self._score(self._keypad_rank(cache[key], keypad_code), cache[key]), cache[key].contact)
+             for key in keys),
+            limit, offset
+        )
+    
+    def reindex(self) -> None:
+        """根据存储中的联系人全量重建id索引和搜索缓存"""
+        self._rebuild_id_index()
+        self._precompute_search_cache()
     
     def convert_to_keypad_code(self, text: str) -> str:
-        """将文本转换为九键键盘数字序列（公开方法）"""
+        """将文本转换为九键键盘数字序列（公开方法），汉字按全拼转换"""
         if not isinstance(text, str):
             raise TypeError("text must be a string")
         
-        keypad_code = []
-        for char in text:
-            if char.isalpha():
-                keypad_code.append(LETTER_TO_KEY.get(char, ''))
-            # 非字母字符跳过
-        return ''.join(keypad_code)
+        return ''.join(self._keypad_word_codes(text))
 
     def add_contact(self, contact: Contact) -> tuple[bool, str]:
         """添加联系人"""
         if not isinstance(contact, Contact):
             raise TypeError("contact must be an instance of Contact")
         
+        self._sync_with_storage()
         # 检查电话号码是否已存在
         existing_contact = self.storage.get_contact_by_phone(contact.phone)
         if existing_contact:
             logger.warning(f"Attempt to add duplicate contact with phone: {contact.phone}")
             return False, "该电话号码已存在"
         
+        # id已被其他联系人占用时（例如复制得到的对象）分配新的id
+        if contact.id in self._contacts_by_id:
+            contact.id = generate_contact_id()
+        
         try:
-            self.storage.contacts.append(contact)
-            self._precompute_search_cache()  # 更新缓存
-            self.storage.save_contacts()
-            logger.info(f"Contact added successfully: {contact.name} ({contact.phone})")
-            return True, "添加成功"
+            # 由存储层负责追加并持久化（日志模式下只追加一条记录）
+            self.storage.add_contact(contact)
         except Exception as e:
             logger.error(f"Failed to add contact: {e}", exc_info=True)
+            self._storage_write_failed()
             return False, f"添加失败: {str(e)}"
+        self._contacts_by_id[contact.id] = contact
+        self._update_cache_entry(contact)  # 更新缓存
+        logger.info(f"Contact added successfully: {contact.name} ({contact.phone})")
+        return True, "添加成功"
 
     def update_contact(self, index: int, contact: Contact) -> tuple[bool, str]:
         """更新联系人"""
@@ -74,41 +475,248 @@ class ContactManager:
         
         if not 0 <= index < len(self.storage.contacts):
             raise IndexError("Invalid contact index")
+        self._sync_with_storage()
         
         # 检查电话号码是否被其他联系人使用
         existing_contact = self.storage.get_contact_by_phone(contact.phone)
-        if existing_contact and self.storage.contacts.index(existing_contact) != index:
+        if existing_contact and existing_contact is not self.storage.contacts[index]:
             logger.warning(f"Attempt to update contact with duplicate phone: {contact.phone}")
             return False, "该电话号码已被其他联系人使用"
         
+        old_contact = self.storage.contacts[index]
+        # 更新后的联系人沿用原有id
+        contact.id = old_contact.id
         try:
-            old_contact = self.storage.contacts[index]
-            self.storage.contacts[index] = contact
-            self._precompute_search_cache()  # 更新缓存
-            self.storage.save_contacts()
-            logger.info(f"Contact updated successfully: {old_contact.name} -> {contact.name} ({contact.phone})")
-            return True, "更新成功"
+            self.storage.update_contact(index, contact)
         except Exception as e:
             logger.error(f"Failed to update contact at index {index}: {e}", exc_info=True)
+            self._storage_write_failed()
             return False, f"更新失败: {str(e)}"
+        self._contacts_by_id[contact.id] = contact
+        self._update_cache_entry(contact)  # 更新缓存
+        logger.info(f"Contact updated successfully: {old_contact.name} -> {contact.name} ({contact.phone})")
+        return True, "更新成功"
 
     def delete_contact(self, index: int) -> tuple[bool, str]:
         """删除联系人"""
         if not 0 <= index < len(self.storage.contacts):
             raise IndexError("Invalid contact index")
+        self._sync_with_storage()
         
+        deleted_contact = self.storage.contacts[index]
         try:
-            deleted_contact = self.storage.contacts.pop(index)
-            self._precompute_search_cache()  # 更新缓存
-            self.storage.save_contacts()
-            logger.info(f"Contact deleted successfully: {deleted_contact.name} ({deleted_contact.phone})")
-            return True, "删除成功"
+            self.storage.delete_contact(index)
         except Exception as e:
             logger.error(f"Failed to delete contact at index {index}: {e}", exc_info=True)
+            self._storage_write_failed()
             return False, f"删除失败: {str(e)}"
+        self._contacts_by_id.pop(deleted_contact.id, None)
+        self._remove_cache_entry(deleted_contact)  # 更新缓存
+        logger.info(f"Contact deleted successfully: {deleted_contact.name} ({deleted_contact.phone})")
+        return True, "删除成功"
+
+    def _index_of(self, contact: Contact) -> int:
+        """获取联系人在存储列表中的位置
+
+        缓存条目的序号与存储列表顺序一致，位置即序号在现有序号中的排名，二分查找即可得到，
+        增删联系人后无需重新编号。
+        """
+        contacts = self.storage.contacts
+        item = self._search_cache.get(contact.id)
+        if item is not None:
+            index = bisect_left(self._orders, item.order)
+            if index < len(contacts) and contacts[index] is contact:
+                return index
+        # 存储层被直接修改且无法察觉时顺序可能不一致，退回线性查找
+        logger.warning(f"Search cache out of order with storage, scanning for contact {contact.id}")
+        return contacts.index(contact)
+
+    def update_contact_by_id(self, contact_id: str, contact: Contact) -> tuple[bool, str]:
+        """根据id更新联系人"""
+        self._sync_with_storage()
+        existing_contact = self._contacts_by_id.get(contact_id)
+        if existing_contact is None:
+            logger.warning(f"Attempt to update missing contact id: {contact_id}")
+            return False, "联系人不存在"
+        return self.update_contact(self._index_of(existing_contact), contact)
+
+    def delete_contact_by_id(self, contact_id: str) -> tuple[bool, str]:
+        """根据id删除联系人"""
+        self._sync_with_storage()
+        existing_contact = self._contacts_by_id.get(contact_id)
+        if existing_contact is None:
+            logger.warning(f"Attempt to delete missing contact id: {contact_id}")
+            return False, "联系人不存在"
+        return self.delete_contact(self._index_of(existing_contact))
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """将多次增删改合并为一次原子持久化
+
+        事务中的修改立即反映在内存和索引中，退出时由存储层一次性写入；发生异常时存储层恢复
+        事务开始时的联系人，管理器随之重建索引，异常继续抛出。嵌套的事务并入最外层事务。
+        """
+        begin = getattr(self.storage, 'transaction', None)
+        if begin is None:
+            raise TypeError("storage does not support transactions")
+        self._transaction_depth += 1
+        try:
+            with begin():
+                yield
+        except BaseException:
+            if self._transaction_depth == 1:
+                self.reindex()
+            raise
+        finally:
+            self._transaction_depth -= 1
+
+    def _bulk_to_storage(self, method: str, items: List[Any], fallback: Callable[[Any], None]) -> None:
+        """调用存储层的批量方法；存储层不支持批量操作时逐个调用fallback"""
+        bulk = getattr(self.storage, method, None)
+        if bulk is not None:
+            bulk(items)
+        else:
+            for item in items:
+                fallback(item)
+
+    def _apply_bulk_changes(self, changed: List[Contact], removed: List[Contact]) -> None:
+        """批量修改后更新id索引和搜索缓存，修改量较大时全量重建一次"""
+        if len(changed) + len(removed) > len(self._search_cache) * BULK_REINDEX_RATIO:
+            self.reindex()
+            return
+        for contact in removed:
+            self._contacts_by_id.pop(contact.id, None)
+            self._remove_cache_entry(contact)
+        for contact in changed:
+            self._contacts_by_id[contact.id] = contact
+            self._update_cache_entry(contact)
+
+    def add_contacts(self, contacts: Iterable[Contact]) -> List[tuple[bool, str]]:
+        """批量添加联系人，只持久化一次、更新一次索引
+
+        返回与输入一一对应的 (是否成功, 消息)，电话号码已存在或在本批次中重复的联系人被跳过。
+        """
+        contacts = list(contacts)
+        for contact in contacts:
+            if not isinstance(contact, Contact):
+                raise TypeError("contact must be an instance of Contact")
+        self._sync_with_storage()
+        
+        results: List[tuple[bool, str]] = []
+        accepted: List[Contact] = []
+        phones: Set[str] = set()
+        ids: Set[str] = set()
+        for contact in contacts:
+            if contact.phone in phones or self.storage.get_contact_by_phone(contact.phone) is not None:
+                results.append((False, "该电话号码已存在"))
+                continue
+            # id已被其他联系人占用时（例如复制得到的对象）分配新的id
+            if contact.id in self._contacts_by_id or contact.id in ids:
+                contact.id = generate_contact_id()
+            phones.add(contact.phone)
+            ids.add(contact.id)
+            accepted.append(contact)
+            results.append((True, "添加成功"))
+        if not accepted:
+            return results
+        
+        try:
+            self._bulk_to_storage('add_contacts', accepted, self.storage.add_contact)
+        except Exception as e:
+            logger.error(f"Failed to add {len(accepted)} contacts: {e}", exc_info=True)
+            # 存储层的批量方法失败时整批撤销；逐个调用时可能已写入部分联系人，
+            # 按存储内容重建索引，并按实际结果报告每一条
+            self.reindex()
+            return [(False, f"添加失败: {str(e)}")
+                    if success and self._contacts_by_id.get(contact.id) is not contact else (success, msg)
+                    for contact, (success, msg) in zip(contacts, results)]
+        self._apply_bulk_changes(accepted, [])
+        logger.info(f"Added {len(accepted)} contacts in bulk, skipped {len(contacts) - len(accepted)}")
+        return results
+
+    def update_many(self, updates: Iterable[Tuple[str, Contact]]) -> List[tuple[bool, str]]:
+        """根据id批量更新联系人，只持久化一次、更新一次索引
+
+        updates为 (联系人id, 新联系人) 序列，返回与输入一一对应的 (是否成功, 消息)。
+        新号码被本批次之外的联系人占用时跳过该条；被本批次中已更新的联系人让出的号码可以使用。
+        """
+        updates = list(updates)
+        for _, contact in updates:
+            if not isinstance(contact, Contact):
+                raise TypeError("contact must be an instance of Contact")
+        self._sync_with_storage()
+        
+        results: List[tuple[bool, str]] = []
+        accepted: List[Tuple[int, Contact]] = []
+        # 本批次已接受的联系人id及其新号码
+        done: Set[str] = set()
+        phones: Set[str] = set()
+        for contact_id, contact in updates:
+            if contact_id not in self._contacts_by_id:
+                results.append((False, "联系人不存在"))
+                continue
+            if contact_id in done:
+                results.append((False, "同一联系人重复更新"))
+                continue
+            owner = self.storage.get_contact_by_phone(contact.phone)
+            if contact.phone in phones or (owner is not None and owner.id != contact_id and owner.id not in done):
+                results.append((False, "该电话号码已被其他联系人使用"))
+                continue
+            # 更新后的联系人沿用原有id
+            contact.id = contact_id
+            done.add(contact_id)
+            phones.add(contact.phone)
+            accepted.append((self._index_of(self._contacts_by_id[contact_id]), contact))
+            results.append((True, "更新成功"))
+        if not accepted:
+            return results
+        
+        try:
+            self._bulk_to_storage('update_contacts', accepted, lambda pair: self.storage.update_contact(*pair))
+        except Exception as e:
+            logger.error(f"Failed to update {len(accepted)} contacts: {e}", exc_info=True)
+            self.reindex()
+            return [(False, f"更新失败: {str(e)}")
+                    if success and self._contacts_by_id.get(contact_id) is not contact else (success, msg)
+                    for (contact_id, contact), (success, msg) in zip(updates, results)]
+        self._apply_bulk_changes([contact for _, contact in accepted], [])
+        logger.info(f"Updated {len(accepted)} contacts in bulk")
+        return results
+
+    def delete_many(self, contact_ids: Iterable[str]) -> List[tuple[bool, str]]:
+        """根据id批量删除联系人，只持久化一次、更新一次索引，返回与输入一一对应的 (是否成功, 消息)"""
+        contact_ids = list(contact_ids)
+        self._sync_with_storage()
+        results: List[tuple[bool, str]] = []
+        removed: List[Contact] = []
+        done: Set[str] = set()
+        for contact_id in contact_ids:
+            if contact_id not in self._contacts_by_id or contact_id in done:
+                results.append((False, "联系人不存在"))
+                continue
+            done.add(contact_id)
+            removed.append(self._contacts_by_id[contact_id])
+            results.append((True, "删除成功"))
+        if not removed:
+            return results
+        
+        # 从后往前排列，存储层逐个删除时前面的位置不受影响
+        indices = sorted((self._index_of(contact) for contact in removed), reverse=True)
+        try:
+            self._bulk_to_storage('delete_contacts', indices,
+                                  lambda index: self.storage.delete_contact(index))
+        except Exception as e:
+            logger.error(f"Failed to delete {len(removed)} contacts: {e}", exc_info=True)
+            self.reindex()
+            return [(False, f"删除失败: {str(e)}")
+                    if success and contact_id in self._contacts_by_id else (success, msg)
+                    for contact_id, (success, msg) in zip(contact_ids, results)]
+        self._apply_bulk_changes([], removed)
+        logger.info(f"Deleted {len(removed)} contacts in bulk")
+        return results
 
-    def search_by_name(self, name: str) -> List[Contact]:
-        """优化的姓名搜索，使用预计算的小写名称"""
+    def search_by_name(self, name: str, limit: Optional[int] = None, offset: int = 0) -> List[Contact]:
+        """优化的姓名搜索，使用预计算的小写名称，结果按相关度排序"""
         if not isinstance(name, str):
             raise TypeError("name must be a string")
         
@@ -116,24 +724,98 @@ class ContactManager:
             return []
         
         name_lower = name.lower()
-        results = [item['contact'] for item in self._search_cache if name_lower in item['name_lower']]
+        results = self._cached_query(('name', name_lower, limit, offset),
+                                     lambda: self._search_name_uncached(name_lower, limit, offset))
         logger.info(f"Name search '{name}' returned {len(results)} results")
         return results
 
-    def search_by_phone(self, phone: str) -> List[Contact]:
-        """优化的电话搜索"""
+    def _search_name_uncached(self, name_lower: str, limit: Optional[int], offset: int) -> List[Contact]:
+        """执行姓名搜索"""
+        # 先用n-gram索引缩小候选集，再校验子串；查询过短无法使用索引时全量扫描
+        candidates = self._name_index.candidates(name_lower) if self._name_index is not None else None
+        if candidates is None:
+            items = self._search_cache.values()
+        else:
+            items = (self._search_cache[contact_id] for contact_id in candidates)
+        return self._top_k(
+            ((self._score(match_rank(item.name_lower, name_lower), item), item.contact)
+             for item in items if name_lower in item.name_lower),
+            limit, offset
+        )
+    
+    def _ensure_fuzzy_index(self) -> FuzzyIndex:
+        """返回模糊索引，尚未建立时根据搜索缓存建立"""
+        if self._fuzzy_index is None:
+            fuzzy_index = FuzzyIndex(self._fuzzy_max_distance)
+            fuzzy_index.rebuild((contact_id, item.name_lower) for contact_id, item in self._search_cache.items())
+            self._fuzzy_index = fuzzy_index
+            logger.info(f"Fuzzy index built with {len(self._search_cache)} contacts")
+        return self._fuzzy_index
+    
+    def search_fuzzy(self, name: str, max_distance: Optional[int] = None,
+                     limit: Optional[int] = None, offset: int = 0) -> List[Contact]:
+        """容错的姓名搜索：查询中的每个词都与名称中某个词的编辑距离不超过max_distance
+
+        max_distance 为None时按词长自动选择：4个字符以内允许1处错误，更长的词允许2处。
+        结果按各词编辑距离之和排序，距离相同时常用联系人优先。
+        """
+        if not isinstance(name, str):
+            raise TypeError("name must be a string")
+        if max_distance is not None and (not isinstance(max_distance, int)
+                                         or not 0 <= max_distance <= self._fuzzy_max_distance):
+            raise ValueError(f"max_distance must be between 0 and {self._fuzzy_max_distance}")
+        
+        words = FuzzyIndex.words(name.lower())
+        if not words:
+            return []
+        
+        results = self._cached_query(('fuzzy', tuple(sorted(words)), max_distance, limit, offset),
+                                     lambda: self._search_fuzzy_uncached(words, max_distance, limit, offset))
+        logger.info(f"Fuzzy search '{name}' returned {len(results)} results")
+        return results
+    
+    def _search_fuzzy_uncached(self, words: Set[str], max_distance: Optional[int],
+                               limit: Optional[int], offset: int) -> List[Contact]:
+        """执行容错姓名搜索"""
+        fuzzy_index = self._ensure_fuzzy_index()
+        distances: Optional[Dict[str, int]] = None
+        for word in words:
+            if max_distance is None:
+                word_distance = min(1 if len(word) <= 4 else 2, self._fuzzy_max_distance)
+            else:
+                word_distance = max_distance
+            matches = fuzzy_index.search(word, word_distance)
+            if distances is None:
+                distances = matches
+            else:
+                distances = {key: total + matches[key] for key, total in distances.items() if key in matches}
+            if not distances:
+                break
+        
+        cache = self._search_cache
+        return self._top_k(
+            ((self._score(distance, cache[key]), cache[key].contact) for key, distance in (distances or {}).items()),
+            limit, offset
+        )
+    
+    def search_by_phone(self, phone: str, limit: Optional[int] = None, offset: int = 0) -> List[Contact]:
+        """优化的电话搜索，结果按相关度排序"""
         if not isinstance(phone, str):
             raise TypeError("phone must be a string")
         
         if not phone:
             return []
         
-        results = [item['contact'] for item in self._search_cache if phone in item['phone']]
+        results = self._cached_query(('phone', phone, limit, offset), lambda: self._top_k(
+            ((self._score(match_rank(item.phone, phone), item), item.contact)
+             for item in self._search_cache.values() if phone in item.phone),
+            limit, offset
+        ))
         logger.info(f"Phone search '{phone}' returned {len(results)} results")
         return results
     
-    def search_by_keypad(self, keypad_code: str) -> List[Contact]:
-        """九键搜索：根据数字序列搜索联系人"""
+    def search_by_keypad(self, keypad_code: str, limit: Optional[int] = None, offset: int = 0) -> List[Contact]:
+        """九键搜索：查找名称中某个词首开始的数字序列以keypad_code开头的联系人，结果按相关度排序"""
         if not isinstance(keypad_code, str):
             raise TypeError("keypad_code must be a string")
         
@@ -144,12 +826,65 @@ class ContactManager:
         if not keypad_code.isdigit():
             raise ValueError("keypad_code must contain only digits")
         
-        results = [item['contact'] for item in self._search_cache if keypad_code in item['keypad_code']]
+        results = self._cached_query(('keypad', keypad_code, limit, offset), lambda: self._rank_keypad_keys(
+            self._keypad_index.keys_in_range(*self._keypad_index.prefix_range(keypad_code)),
+            keypad_code, limit, offset
+        ))
         logger.info(f"Keypad search '{keypad_code}' returned {len(results)} results")
         return results
     
-    def search_by_email(self, email: str) -> List[Contact]:
-        """根据邮箱搜索联系人"""
+    def keypad_session(self) -> 'KeypadSearchSession':
+        """创建一个九键搜索会话，用于逐位输入时增量缩小结果"""
+        return KeypadSearchSession(self)
+    
+    def unified_search(self, term: str, limit: Optional[int] = None, offset: int = 0) -> List[Contact]:
+        """统一搜索：一次遍历同时匹配姓名、电话、邮箱和九键序列
+
+        每个联系人只出现一次，按最佳匹配程度（完全相同、前缀、词首、子串）排序，
+        程度相同时常用联系人优先，其余保持存储顺序。纯数字的查询还会通过九键索引匹配姓名。
+        """
+        if not isinstance(term, str):
+            raise TypeError("term must be a string")
+        
+        term = term.strip()
+        if not term:
+            return []
+        
+        results = self._cached_query(('unified', term, limit, offset),
+                                     lambda: self._unified_search_uncached(term, limit, offset))
+        logger.info(f"Unified search '{term}' returned {len(results)} results")
+        return results
+    
+    def _unified_search_uncached(self, term: str, limit: Optional[int], offset: int) -> List[Contact]:
+        """执行统一搜索"""
+        keypad_keys = set()
+        if term.isdigit():
+            keypad_keys = self._keypad_index.keys_in_range(*self._keypad_index.prefix_range(term))
+        return self._top_k(self._unified_matches(term.lower(), keypad_keys), limit, offset)
+    
+    def _unified_matches(self, term_lower: str, keypad_keys: Set[str]):
+        """逐个产生统一搜索命中的 (排序键, 联系人)"""
+        for contact_id, item in self._search_cache.items():
+            texts = (item.name_lower, item.phone, item.email_lower)
+            # 先用子串判断快速排除不匹配的联系人，只对命中的联系人计算匹配程度
+            if not (term_lower in texts[0] or term_lower in texts[1] or term_lower in texts[2]
+                    or contact_id in keypad_keys):
+                continue
+            best = None
+            for text in texts:
+                rank = match_rank(text, term_lower)
+                if rank is not None and (best is None or rank < best):
+                    best = rank
+                    if best == MATCH_EXACT:
+                        break
+            if contact_id in keypad_keys and (best is None or best > MATCH_WORD_START):
+                # 九键序列按词首匹配
+                best = MATCH_WORD_START
+            if best is not None:
+                yield self._score(best, item), item.contact
+    
+    def search_by_email(self, email: str, limit: Optional[int] = None, offset: int = 0) -> List[Contact]:
+        """根据邮箱搜索联系人，结果按相关度排序"""
         if not isinstance(email, str):
             raise TypeError("email must be a string")
         
@@ -157,17 +892,134 @@ class ContactManager:
             return []
         
         email_lower = email.lower()
-        results = [item['contact'] for item in self._search_cache if email_lower in item['contact'].email.lower()]
+        results = self._cached_query(('email', email_lower, limit, offset),
+                                     lambda: self._search_email_uncached(email_lower, limit, offset))
         logger.info(f"Email search '{email}' returned {len(results)} results")
         return results
 
-    def get_all_contacts(self) -> List[Contact]:
-        """获取所有联系人"""
-        return self.storage.contacts.copy()
+    def plan_query(self, query: str) -> QueryPlan:
+        """解析结构化查询并生成查询计划"""
+        return plan_query(parse_query(query), self._query_indexes, len(self._search_cache))
+    
+    def explain(self, query: str) -> str:
+        """返回结构化查询的执行计划和估计行数"""
+        return self.plan_query(query).explain()
+    
+    def query(self, query: str, limit: Optional[int] = None, offset: int = 0) -> List[Contact]:
+        """执行结构化查询，例如 `country:中国 frequent:yes email:@qq.com name:li`
+
+        各条件之间为“与”关系，语法见query.parse_query；语法错误时抛出QuerySyntaxError。
+        结果中常用联系人优先，其余按存储顺序排列。
+        """
+        predicates = parse_query(query)
+        if not predicates:
+            return []
+        
+        key = ('query', tuple(sorted(str(predicate) for predicate in predicates)), limit, offset)
+        results = self._cached_query(key, lambda: self._execute_query(predicates, limit, offset))
+        logger.info(f"Query '{query}' returned {len(results)} results")
+        return results
+    
+    def _execute_query(self, predicates: List[Predicate], limit: Optional[int], offset: int) -> List[Contact]:
+        """按查询计划执行：先求索引候选集的交集，再检查其余条件"""
+        plan = plan_query(predicates, self._query_indexes, len(self._search_cache))
+        if plan.index_steps:
+            keys: Optional[Set[str]] = None
+            for step in plan.index_steps:
+                found = step.index.lookup(step.predicate)
+                keys = found if keys is None else keys & found
+                if not keys:
+                    break
+            items = [self._search_cache[key] for key in keys]
+        else:
+            items = self._search_cache.values()
+        
+        filters = plan.filters
+        return self._top_k(
+            ((self._score(MATCH_EXACT, item), item.contact)
+             for item in items if all(predicate.matches(item) for predicate in filters)),
+            limit, offset
+        )
+    
+    def _search_email_uncached(self, email_lower: str, limit: Optional[int], offset: int) -> List[Contact]:
+        """执行邮箱搜索，以@开头的查询通过域名索引只检查相关域名下的联系人"""
+        if email_lower.startswith('@'):
+            items = [self._search_cache[key] for key in self._keys_for_domains(self._matching_domains(email_lower))]
+        else:
+            items = self._search_cache.values()
+        return self._top_k(
+            ((self._score(match_rank(item.email_lower, email_lower), item), item.contact)
+             for item in items if email_lower in item.email_lower),
+            limit, offset
+        )
+    
+    def filter_contacts(self, country: Optional[str] = None, email_domain: Optional[str] = None,
+                        frequent: Optional[bool] = None, limit: Optional[int] = None,
+                        offset: int = 0) -> List[Contact]:
+        """按国家/地区、邮箱域名和常用标记筛选联系人，未指定的条件不限制
+
+        直接对各二级索引的id集合求交集，代价与结果数量成正比。结果中常用联系人优先，其余按存储顺序排列。
+        """
+        if email_domain is not None:
+            email_domain = email_domain.lower().lstrip('@')
+        results = self._cached_query(('filter', country, email_domain, frequent, limit, offset),
+                                     lambda: self._filter_uncached(country, email_domain, frequent, limit, offset))
+        logger.info(f"Filter country={country} email_domain={email_domain} frequent={frequent} "
+                    f"returned {len(results)} results")
+        return results
+    
+    def _filter_uncached(self, country: Optional[str], email_domain: Optional[str], frequent: Optional[bool],
+                         limit: Optional[int], offset: int) -> List[Contact]:
+        """执行分面筛选：从最小的id集合开始求交集"""
+        facets = []
+        if country is not None:
+            facets.append(self._country_index.get(country, set()))
+        if email_domain is not None:
+            facets.append(self._email_domain_index.get(email_domain, set()))
+        if frequent is not None:
+            facets.append(self.frequent_view.members if frequent
+                          else self._search_cache.keys() - self.frequent_view.members)
+        
+        if facets:
+            facets.sort(key=len)
+            keys = set(facets[0])
+            for facet in facets[1:]:
+                keys &= facet
+            items = (self._search_cache[key] for key in keys)
+        else:
+            items = self._search_cache.values()
+        return self._top_k(((self._score(MATCH_EXACT, item), item.contact) for item in items), limit, offset)
+    
+    def get_country_counts(self) -> Dict[str, int]:
+        """获取各国家/地区的联系人数量"""
+        return {country: len(keys) for country, keys in self._country_index.items()}
+    
+    def get_all_contacts(self) -> ContactsView:
+        """获取所有联系人的只读快照，不复制列表，之后的增删改不会影响已返回的快照"""
+        snapshot = getattr(self.storage, 'snapshot', None)
+        if snapshot is None:
+            # 不支持快照的存储只能复制列表
+            return ContactsView(list(self.storage.contacts))
+        return snapshot()
 
     def get_frequent_contacts(self) -> List[Contact]:
         """获取常用联系人"""
-        return [item['contact'] for item in self._search_cache if item['contact'].is_frequent]
+        return [self._contacts_by_id[contact_id] for contact_id in self.frequent_view.ids()]
+    
+    def toggle_frequent(self, contact_id: str) -> tuple[bool, str]:
+        """切换联系人的常用标记"""
+        self._sync_with_storage()
+        contact = self._contacts_by_id.get(contact_id)
+        if contact is None:
+            logger.warning(f"Attempt to toggle missing contact id: {contact_id}")
+            return False, "联系人不存在"
+        updated = Contact(contact.name, contact.phone, contact.email, contact.remark,
+                          not contact.is_frequent, contact.id)
+        return self.update_contact_by_id(contact_id, updated)
+    
+    def get_contact_by_id(self, contact_id: str) -> Optional[Contact]:
+        """根据id获取联系人"""
+        return self._contacts_by_id.get(contact_id)
     
     def get_contact_by_index(self, index: int) -> Optional[Contact]:
         """根据索引获取联系人"""
@@ -178,3 +1030,188 @@ class ContactManager:
     def get_contacts_count(self) -> int:
         """获取联系人总数"""
         return len(self.storage.contacts)
+
+class KeypadSearchSession:
+    """九键搜索会话
+
+    记录每输入一位数字后在九键索引中对应的区间和命中集合：追加数字时只在上一级区间内
+    二分查找，退格时直接回到上一级已缓存的状态。联系人变化后缓存的区间失效，
+    下次查询时按当前输入重新定位。
+    """
+
+    def __init__(self, manager: ContactManager):
+        """初始化空会话"""
+        self._manager = manager
+        self._digits: List[str] = []
+        # 与_digits一一对应：输入到该位时的索引区间，以及按需生成的命中联系人键
+        self._ranges: List[Tuple[int, int]] = []
+        self._keys: List[Optional[Set[str]]] = []
+        self._generation: int = manager._generation
+
+    @property
+    def code(self) -> str:
+        """当前输入的数字序列"""
+        return ''.join(self._digits)
+
+    def _narrow(self, digit: str) -> None:
+        """在上一级区间内定位追加一位数字后的区间"""
+        lo, hi = self._ranges[-1] if self._ranges else (0, None)
+        self._ranges.append(self._manager._keypad_index.prefix_range(self.code + digit, lo, hi))
+        self._digits.append(digit)
+        self._keys.append(None)
+
+    def _truncate(self, length: int) -> None:
+        """退回到前length位数字的状态"""
+        length = max(length, 0)
+        del self._digits[length:]
+        del self._ranges[length:]
+        del self._keys[length:]
+
+    def _revalidate(self) -> None:
+        """联系人变化后按当前输入重新定位各级区间"""
+        self._manager._sync_with_storage()
+        if self._generation == self._manager._generation:
+            return
+        digits = self._digits
+        self.reset()
+        for digit in digits:
+            self._narrow(digit)
+
+    def push(self, digit: str, limit: Optional[int] = None, offset: int = 0) -> List[Contact]:
+        """追加一位数字并返回缩小后的结果"""
+        if not isinstance(digit, str) or len(digit) != 1 or not digit.isdigit():
+            raise ValueError("digit must be a single digit")
+        self._revalidate()
+        self._narrow(digit)
+        return self.results(limit, offset)
+
+    def pop(self, limit: Optional[int] = None, offset: int = 0) -> List[Contact]:
+        """删除最后一位数字并返回上一级的结果"""
+        self._revalidate()
+        self._truncate(len(self._digits) - 1)
+        return self.results(limit, offset)
+
+    def reset(self) -> None:
+        """清空输入"""
+        self._digits = []
+        self._ranges = []
+        self._keys = []
+        self._generation = self._manager._generation
+
+    def search(self, keypad_code: str, limit: Optional[int] = None, offset: int = 0) -> List[Contact]:
+        """将会话同步到keypad_code并返回结果，只重新计算与当前输入不同的部分"""
+        if not isinstance(keypad_code, str):
+            raise TypeError("keypad_code must be a string")
+        if keypad_code and not keypad_code.isdigit():
+            raise ValueError("keypad_code must contain only digits")
+        self._revalidate()
+        common = 0
+        while common < min(len(self._digits), len(keypad_code)) and self._digits[common] == keypad_code[common]:
+            common += 1
+        self._truncate(common)
+        for digit in keypad_code[common:]:
+            self._narrow(digit)
+        return self.results(limit, offset)
+
+    def _current_keys(self) -> Set[str]:
+        """当前输入命中的联系人键，首次访问时从索引区间生成并缓存"""
+        self._revalidate()
+        if not self._digits:
+            return set()
+        keys = self._keys[-1]
+        if keys is None:
+            keys = self._manager._keypad_index.keys_in_range(*self._ranges[-1])
+            self._keys[-1] = keys
+        return keys
+
+    def matches(self, contact_id: str) -> bool:
+        """判断联系人是否命中当前输入，无需重新定位区间"""
+        item = self._manager._search_cache.get(contact_id)
+        if item is None or not self._digits:
+            return False
+        code = self.code
+        return any(sequence.startswith(code) for sequence in item.keypad_sequences)
+
+    def count(self) -> int:
+        """当前输入命中的联系人总数"""
+        return len(self._current_keys())
+
+    def results(self, limit: Optional[int] = None, offset: int = 0) -> List[Contact]:
+        """返回当前输入对应的联系人，按相关度排序并分页"""
+        keys = self._current_keys()
+        results = self._manager._rank_keypad_keys(keys, self.code, limit, offset)
+        logger.info(f"Keypad session '{self.code}' returned {len(results)} of {len(keys)} results")
+        return results
+
+class FrequentContactsView:
+    """常用联系人的物化视图
+
+    按存储顺序维护常用联系人id，联系人的常用标记或信息变化时由管理器增量更新，
+    并以 (事件, 联系人id, 位置) 通知订阅者：added/removed/updated 对应视图中插入、删除、
+    修改的行，reset 表示视图已整体重建（联系人id为None，位置为-1）。
+    """
+
+    def __init__(self):
+        """初始化空视图"""
+        # 两个平行列表：_orders为有序的存储序号，_ids[i]为对应的联系人id
+        self._orders: List[int] = []
+        self._ids: List[str] = []
+        self._members: Set[str] = set()
+        self._listeners: List[Callable[[str, Optional[str], int], None]] = []
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, contact_id: str) -> bool:
+        return contact_id in self._members
+
+    @property
+    def members(self) -> Set[str]:
+        """视图中的联系人id集合（只读）"""
+        return self._members
+
+    def ids(self) -> List[str]:
+        """按存储顺序返回视图中的联系人id"""
+        return list(self._ids)
+
+    def subscribe(self, listener: Callable[[str, Optional[str], int], None]) -> None:
+        """订阅视图变化事件"""
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[str, Optional[str], int], None]) -> None:
+        """取消订阅"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _emit(self, event: str, contact_id: Optional[str], position: int) -> None:
+        """通知订阅者，单个订阅者出错不影响其他订阅者和数据更新"""
+        for listener in list(self._listeners):
+            try:
+                listener(event, contact_id, position)
+            except Exception as e:
+                logger.error(f"Frequent view listener failed on {event} {contact_id}: {e}", exc_info=True)
+
+    def rebuild(self, entries: Iterable[Tuple[int, str]]) -> None:
+        """根据 (存储序号, 联系人id) 重建视图并通知订阅者"""
+        pairs = sorted(entries)
+        self._orders = [order for order, _ in pairs]
+        self._ids = [contact_id for _, contact_id in pairs]
+        self._members = set(self._ids)
+        self._emit('reset', None, -1)
+
+    def apply(self, contact_id: str, order: int, was_member: bool, is_member: bool) -> None:
+        """根据联系人变化前后是否为常用联系人更新视图"""
+        if was_member and is_member:
+            self._emit('updated', contact_id, bisect_left(self._orders, order))
+        elif is_member:
+            position = bisect_left(self._orders, order)
+            self._orders.insert(position, order)
+            self._ids.insert(position, contact_id)
+            self._members.add(contact_id)
+            self._emit('added', contact_id, position)
+        elif was_member:
+            position = bisect_left(self._orders, order)
+            del self._orders[position]
+            del self._ids[position]
+            self._members.discard(contact_id)
+            self._emit('removed', contact_id, position)
@@ -0,0 +1,54 @@
+from collections.abc import Sequence
+from typing import Iterator, List, Optional, Union
+from contact import Contact
+
+class ContactsView(Sequence):
+    """联系人列表的只读快照
+
+    与存储层共享同一个列表，创建时不复制任何数据。存储层在快照仍被引用时若要修改列表，
+    会先复制出新列表再修改（写时复制），因此快照的内容始终保持创建时的状态，
+    读取方可以放心迭代，不会被并发的修改打断。
+    """
+
+    __slots__ = ('_items', 'version', '__weakref__')
+
+    def __init__(self, items: List[Contact], version: int = 0):
+        """包装items，调用方保证此后不再原地修改该列表；version为创建时的数据版本"""
+        self._items = items
+        self.version = version
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Contact, List[Contact]]:
+        # 切片返回普通列表，只复制切片范围内的元素
+        return self._items[index]
+
+    def __iter__(self) -> Iterator[Contact]:
+        return iter(self._items)
+
+    def __reversed__(self) -> Iterator[Contact]:
+        return reversed(self._items)
+
+    def __contains__(self, contact: object) -> bool:
+        return contact in self._items
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, ContactsView):
+            return self._items == other._items
+        if isinstance(other, list):
+            return self._items == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"ContactsView({len(self._items)} contacts, version={self.version})"
+
+    def index(self, contact: Contact, start: int = 0, stop: Optional[int] = None) -> int:
+        """返回联系人在快照中的位置"""
+        if stop is None:
+            stop = len(self._items)
+        return self._items.index(contact, start, stop)
+
+    def count(self, contact: Contact) -> int:
+        """返回联系人在快照中出现的次数"""
+        return self._items.count(contact)
@@ -109,11 +109,10 @@ class AddContactDialog:
             logger.error(f"Unexpected error when adding contact: {e}", exc_info=True)
 
 class EditContactDialog:
-    def __init__(self, parent: tk.Tk, manager: Any, index: int, contact: Contact, refresh_callback: Callable[[], None]):
+    def __init__(self, parent: tk.Tk, manager: Any, contact: Contact, refresh_callback: Callable[[], None]):
         """初始化修改联系人对话框"""
         self.parent = parent
         self.manager = manager
-        self.index = index
         self.contact = contact
         self.refresh_callback = refresh_callback
         self.dialog = tk.Toplevel(parent)
@@ -211,7 +210,7 @@ class EditContactDialog:
 
         try:
             contact = Contact(name, phone, email, remark, is_frequent)
-            success, msg = self.manager.update_contact(self.index, contact)
+            success, msg = self.manager.update_contact_by_id(self.contact.id, contact)
             if success:
                 logger.info(f"Contact updated successfully: {name} ({phone})")
                 self.refresh_callback()
@@ -2,6 +2,9 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
 
+# 九键搜索结果最多显示的条数，按相关度取前若干个
+KEYPAD_RESULT_LIMIT = 50
+
 class KeypadSearchPage:
     def __init__(self, parent, manager, refresh_callback, update_detail_callback=None):
         self.parent = parent
@@ -10,7 +13,9 @@ class KeypadSearchPage:
         self.update_detail_callback = update_detail_callback  # 用于更新主窗口详情
         self.keypad_window = None  # 独立拨号键盘窗口
         self.keypad_input_var = tk.StringVar()  # 九键输入变量
+        self.keypad_session = manager.keypad_session()  # 逐位输入时增量缩小结果
         self.setup_ui()
+        self.manager.subscribe(self.on_contacts_changed)
     
     def setup(self):
         pass
@@ -199,6 +204,7 @@ class KeypadSearchPage:
     def keypad_clear(self):
         """清除九键输入"""
         self.keypad_input_var.set("")
+        self.keypad_session.reset()
         self.keypad_result_var.set("请使用下方拨号键盘输入数字")
         # 清空Treeview中的所有项
         for item in self.keypad_result_list.get_children():
@@ -219,8 +225,8 @@ class KeypadSearchPage:
             self.keypad_result_var.set("请输入数字后再搜索")
             return
         
-        results = self.manager.search_by_keypad(search_term)
-        self.keypad_display_results(results, search_term)
+        results = self.keypad_session.search(search_term, limit=KEYPAD_RESULT_LIMIT)
+        self.keypad_display_results(results, search_term, self.keypad_session.count())
     
     def keypad_auto_search(self):
         """自动搜索（输入时实时搜索）"""
@@ -232,11 +238,12 @@ class KeypadSearchPage:
                 self.keypad_result_list.delete(item)
             return
         
-        results = self.manager.search_by_keypad(search_term)
-        self.keypad_display_results(results, search_term)
+        # 追加或删除一位数字时，会话只在上一级结果的基础上缩小或直接回退
+        results = self.keypad_session.search(search_term, limit=KEYPAD_RESULT_LIMIT)
+        self.keypad_display_results(results, search_term, self.keypad_session.count())
     
-    def keypad_display_results(self, results, search_term):
-        """显示九键搜索结果"""
+    def keypad_display_results(self, results, search_term, total=None):
+        """显示九键搜索结果，total为命中总数（结果只包含前若干个）"""
         # 清空Treeview
         for item in self.keypad_result_list.get_children():
             self.keypad_result_list.delete(item)
@@ -245,28 +252,45 @@ class KeypadSearchPage:
             self.keypad_result_var.set(f"未找到匹配 '{search_term}' 的联系人")
             return
         
-        self.keypad_result_var.set(f"找到 {len(results)} 个匹配的联系人")
+        if total is not None and total > len(results):
+            self.keypad_result_var.set(f"找到 {total} 个匹配的联系人，显示最相关的 {len(results)} 个")
+        else:
+            self.keypad_result_var.set(f"找到 {len(results)} 个匹配的联系人")
         for contact in results:
             status = "常用" if contact.is_frequent else ""
-            # 使用格式化后的电话号码显示，但保留原始电话号码用于查找
+            # 使用格式化后的电话号码显示
             formatted_phone = contact.format_phone()
-            # 插入Treeview行，同时存储原始电话号码作为iid
-            self.keypad_result_list.insert('', tk.END, iid=contact.phone, values=(status, contact.name, formatted_phone, contact.email))
+            # 插入Treeview行，使用联系人id作为iid
+            self.keypad_result_list.insert('', tk.END, iid=contact.id, values=(status, contact.name, formatted_phone, contact.email))
+    
+    def on_contacts_changed(self, event, contact_id):
+        """联系人变化时只修改受影响的结果行，不重新搜索"""
+        result_list = self.keypad_result_list
+        if event == 'reset':
+            if self.keypad_session.code:
+                self.keypad_search()
+            return
+        if event != 'removed' and self.keypad_session.matches(contact_id):
+            contact = self.manager.get_contact_by_id(contact_id)
+            status = "常用" if contact.is_frequent else ""
+            values = (status, contact.name, contact.format_phone(), contact.email)
+            if result_list.exists(contact_id):
+                result_list.item(contact_id, values=values)
+            elif len(result_list.get_children()) < KEYPAD_RESULT_LIMIT:
+                result_list.insert('', tk.END, iid=contact_id, values=values)
+        elif result_list.exists(contact_id):
+            # 联系人已删除或修改后不再匹配当前输入
+            result_list.delete(contact_id)
     
     def on_keypad_result_select(self, event):
         """处理九键搜索结果选择，通知主窗口更新详情"""
         selection = self.keypad_result_list.selection()
         if selection:
-            # 使用iid作为原始电话号码
-            original_phone = selection[0]
-            
-            # 查找对应的联系人对象
-            for contact in self.manager.storage.contacts:
-                if contact.phone == original_phone:
-                    # 通知主窗口更新详情
-                    if self.update_detail_callback:
-                        self.update_detail_callback(contact)
-                    break
+            # iid即联系人id
+            contact = self.manager.get_contact_by_id(selection[0])
+            # 通知主窗口更新详情
+            if contact and self.update_detail_callback:
+                self.update_detail_callback(contact)
     
     def on_keypad_result_double_click(self, event):
         """处理九键搜索结果双击事件（编辑联系人）"""
@@ -274,12 +298,8 @@ class KeypadSearchPage:
         if not selection:
             return
         
-        # 使用iid作为原始电话号码
-        original_phone = selection[0]
-        
-        # 查找对应的联系人对象
-        for i, contact in enumerate(self.manager.storage.contacts):
-            if contact.phone == original_phone:
-                from gui.dialogs import EditContactDialog
-                EditContactDialog(self.parent.winfo_toplevel(), self.manager, i, contact, self.refresh_callback)
-                break
+        # iid即联系人id
+        contact = self.manager.get_contact_by_id(selection[0])
+        if contact:
+            from gui.dialogs import EditContactDialog
+            EditContactDialog(self.parent.winfo_toplevel(), self.manager, contact, self.refresh_callback)
@@ -6,6 +6,10 @@ from exporter import ExcelExporter, TXTExporter, MDExporter
 from importer import DataImporter
 from gui.dialogs import AddContactDialog, EditContactDialog
 from gui.keypad import KeypadSearchPage
+from query import QuerySyntaxError, is_structured_query
+
+# 搜索结果最多显示的条数，按相关度取前若干个
+SEARCH_RESULT_LIMIT = 200
 
 class ContactGUI:
     def __init__(self, root, storage, manager):
@@ -32,8 +36,13 @@ class ContactGUI:
         self.current_tab = "全部联系人"
         self.current_contacts = self.manager.get_all_contacts()
         self.selected_contact = None  # 用于跟踪当前选中的联系人
+        # 列表是否与管理器中的数据一致，一致时只按变化事件增量更新，不再整表重绘
+        self.contact_list_synced = False
+        self.frequent_list_synced = False
 
         self.setup_ui()
+        self.manager.subscribe(self.on_contacts_changed)
+        self.manager.frequent_view.subscribe(self.on_frequent_view_changed)
         self.refresh_contact_list()
 
     def setup_style(self):
@@ -347,12 +356,19 @@ class ContactGUI:
 
     def refresh_contact_list(self):
         # 确定当前使用的Treeview
+        # 列表已随变化事件增量更新时无需重绘
         if self.current_tab == "全部联系人":
+            if self.contact_list_synced:
+                return
             current_tree = self.contact_list
             self.current_contacts = self.manager.get_all_contacts()
+            self.contact_list_synced = True
         elif self.current_tab == "常用联系人":
+            if self.frequent_list_synced:
+                return
             current_tree = self.frequent_list
             self.current_contacts = self.manager.get_frequent_contacts()
+            self.frequent_list_synced = True
         else:
             # 九键搜索标签页，不更新列表
             return
@@ -362,11 +378,62 @@ class ContactGUI:
             current_tree.delete(item)
         
         for contact in self.current_contacts:
-            status = "常用" if contact.is_frequent else ""
-            # 使用格式化后的电话号码
-            formatted_phone = contact.format_phone()
-            # 插入Treeview行
-            current_tree.insert('', tk.END, values=(status, contact.name, formatted_phone, contact.email))
+            # 插入Treeview行，使用联系人id作为iid
+            current_tree.insert('', tk.END, iid=contact.id, values=self._row_values(contact))
+
+    def _row_values(self, contact):
+        # Treeview行的显示内容，电话号码使用格式化后的形式
+        status = "常用" if contact.is_frequent else ""
+        return (status, contact.name, contact.format_phone(), contact.email)
+
+    def on_contacts_changed(self, event, contact_id):
+        # 联系人变化时只插入、删除或修改受影响的行
+        if event == 'reset':
+            self.contact_list_synced = False
+            if self.current_tab == "全部联系人":
+                self.refresh_contact_list()
+            return
+        trees = [self.contact_list]
+        if not self.frequent_list_synced:
+            # 常用联系人列表显示搜索结果时，同样修改或删除其中的行
+            trees.append(self.frequent_list)
+        contact = self.manager.get_contact_by_id(contact_id)
+        for tree in trees:
+            if event == 'removed':
+                if tree.exists(contact_id):
+                    tree.delete(contact_id)
+            elif event == 'updated':
+                if tree.exists(contact_id):
+                    tree.item(contact_id, values=self._row_values(contact))
+            elif event == 'added' and tree is self.contact_list and self.contact_list_synced:
+                # 新联系人追加在存储末尾，与列表顺序一致
+                tree.insert('', tk.END, iid=contact_id, values=self._row_values(contact))
+
+    def on_frequent_view_changed(self, event, contact_id, position):
+        # 常用视图变化时只插入、删除或修改受影响的行
+        if not self.frequent_list_synced:
+            return
+        if event == 'reset':
+            self.frequent_list_synced = False
+            if self.current_tab == "常用联系人":
+                self.refresh_contact_list()
+            return
+        if event == 'removed':
+            if self.frequent_list.exists(contact_id):
+                self.frequent_list.delete(contact_id)
+            return
+        values = self._row_values(self.manager.get_contact_by_id(contact_id))
+        if event == 'added':
+            self.frequent_list.insert('', position, iid=contact_id, values=values)
+        elif self.frequent_list.exists(contact_id):
+            self.frequent_list.item(contact_id, values=values)
+
+    def _get_selected_contact(self, tree):
+        """根据Treeview选中行的iid（联系人id）获取联系人"""
+        selection = tree.selection()
+        if not selection:
+            return None
+        return self.manager.get_contact_by_id(selection[0])
 
     def on_treeview_select(self, event):
         # 获取触发事件的Treeview
@@ -381,27 +448,16 @@ class ContactGUI:
         else:
             widget = event.widget
         
-        selection = widget.selection()
-        if selection:
-            item_id = selection[0]
-            # 获取选中行的值
-            values = widget.item(item_id, 'values')
-            if values:
-                # 查找对应的联系人对象
-                formatted_phone = values[2]
-                # 从格式化的电话号码中提取原始电话号码（去掉前缀和空格）
-                original_phone = formatted_phone.replace('+86 ', '').replace('+', '')
-                for contact in self.current_contacts:
-                    if contact.phone.replace('+86', '').replace('+', '') == original_phone:
-                        # 显示联系人详情
-                        self.name_var.set(contact.name)
-                        self.phone_var.set(contact.phone)
-                        self.email_var.set(contact.email)
-                        self.remark_var.set(contact.remark)
-                        self.country_var.set(contact.country)
-                        # 更新当前选中的联系人
-                        self.selected_contact = contact
-                        break
+        contact = self._get_selected_contact(widget)
+        if contact:
+            # 显示联系人详情
+            self.name_var.set(contact.name)
+            self.phone_var.set(contact.phone)
+            self.email_var.set(contact.email)
+            self.remark_var.set(contact.remark)
+            self.country_var.set(contact.country)
+            # 更新当前选中的联系人
+            self.selected_contact = contact
     
     def on_contact_select(self, event):
         # 兼容旧的Listbox选择事件，实际使用on_treeview_select
@@ -426,75 +482,35 @@ class ContactGUI:
         if self.current_tab == "全部联系人" or self.current_tab == "常用联系人":
             # Treeview控件
             current_tree = self.contact_list if self.current_tab == "全部联系人" else self.frequent_list
-            selection = current_tree.selection()
-            
-            if not selection:
-                messagebox.showwarning("警告", "请先选择一个联系人")
-                return
-            
-            item_id = selection[0]
-            values = current_tree.item(item_id, 'values')
-            if values:
-                formatted_phone = values[2]
-                # 从格式化的电话号码中提取原始电话号码
-                # 移除国家代码和空格
-                original_phone = formatted_phone.replace('+86 ', '').replace('+', '').replace(' ', '')
-                
-                # 查找对应的联系人对象
-                for i, contact in enumerate(self.storage.contacts):
-                    # 比较时也移除国家代码和空格
-                    contact_phone_clean = contact.phone.replace('+86', '').replace('+', '').replace(' ', '')
-                    if contact_phone_clean == original_phone:
-                        EditContactDialog(self.root, self.manager, i, contact, self.refresh_contact_list)
-                        break
         else:
             # 九键搜索标签页，使用九键结果Treeview
             current_tree = self.keypad_page.keypad_result_list
-            selection = current_tree.selection()
-            
-            if not selection:
-                messagebox.showwarning("警告", "请先选择一个联系人")
-                return
-            
-            # 使用iid作为原始电话号码
-            original_phone = selection[0]
-            
-            # 查找对应的联系人对象
-            for i, contact in enumerate(self.storage.contacts):
-                if contact.phone == original_phone:
-                    EditContactDialog(self.root, self.manager, i, contact, self.refresh_contact_list)
-                    break
+        
+        if not current_tree.selection():
+            messagebox.showwarning("警告", "请先选择一个联系人")
+            return
+        
+        contact = self._get_selected_contact(current_tree)
+        if contact:
+            EditContactDialog(self.root, self.manager, contact, self.refresh_contact_list)
 
     def delete_contact(self):
         # 确定当前使用的Treeview
         if self.current_tab == "全部联系人" or self.current_tab == "常用联系人":
             current_tree = self.contact_list if self.current_tab == "全部联系人" else self.frequent_list
-            selection = current_tree.selection()
             
-            if not selection:
+            if not current_tree.selection():
                 messagebox.showwarning("警告", "请先选择一个联系人")
                 return
             
-            item_id = selection[0]
-            values = current_tree.item(item_id, 'values')
-            if values:
-                formatted_phone = values[2]
-                # 从格式化的电话号码中提取原始电话号码
-                original_phone = formatted_phone.replace('+86 ', '').replace('+', '').replace(' ', '')
-                
-                # 查找对应的联系人对象
-                for contact in self.current_contacts:
-                    contact_phone_clean = contact.phone.replace('+86', '').replace('+', '').replace(' ', '')
-                    if contact_phone_clean == original_phone:
-                        if messagebox.askyesno("确认", f"确定要删除联系人 {contact.name} 吗?"):
-                            original_index = self.storage.contacts.index(contact)
-                            success, msg = self.manager.delete_contact(original_index)
-                            if success:
-                                self.refresh_contact_list()
-                                self.clear_detail()
-                            else:
-                                messagebox.showerror("错误", msg)
-                        break
+            contact = self._get_selected_contact(current_tree)
+            if contact and messagebox.askyesno("确认", f"确定要删除联系人 {contact.name} 吗?"):
+                success, msg = self.manager.delete_contact_by_id(contact.id)
+                if success:
+                    self.refresh_contact_list()
+                    self.clear_detail()
+                else:
+                    messagebox.showerror("错误", msg)
         else:
             # 九键搜索标签页，不支持直接删除
             messagebox.showinfo("提示", "请在全部联系人或常用联系人标签页中进行删除操作")
@@ -504,33 +520,22 @@ class ContactGUI:
         # 确定当前使用的Treeview
         if self.current_tab == "全部联系人" or self.current_tab == "常用联系人":
             current_tree = self.contact_list if self.current_tab == "全部联系人" else self.frequent_list
-            selection = current_tree.selection()
             
-            if not selection:
+            if not current_tree.selection():
                 messagebox.showwarning("警告", "请先选择一个联系人")
                 return
             
-            item_id = selection[0]
-            values = current_tree.item(item_id, 'values')
-            if values:
-                formatted_phone = values[2]
-                # 从格式化的电话号码中提取原始电话号码
-                original_phone = formatted_phone.replace('+86 ', '').replace('+', '').replace(' ', '')
-                
-                # 查找对应的联系人对象
-                for contact in self.current_contacts:
-                    contact_phone_clean = contact.phone.replace('+86', '').replace('+', '').replace(' ', '')
-                    if contact_phone_clean == original_phone:
-                        original_index = self.storage.contacts.index(contact)
-                        contact.is_frequent = not contact.is_frequent
-                        success, msg = self.manager.update_contact(original_index, contact)
-                        if success:
-                            self.refresh_contact_list()
-                            # 重新选择联系人以更新详情
-                            self.on_treeview_select(None)
-                        else:
-                            messagebox.showerror("错误", msg)
-                        break
+            contact = self._get_selected_contact(current_tree)
+            if contact:
+                success, msg = self.manager.toggle_frequent(contact.id)
+                if success:
+                    self.refresh_contact_list()
+                    # 重新选择联系人以更新详情
+                    if current_tree.exists(contact.id):
+                        current_tree.selection_set(contact.id)
+                    self.on_treeview_select(None)
+                else:
+                    messagebox.showerror("错误", msg)
         else:
             # 九键搜索标签页，不支持直接标记
             messagebox.showinfo("提示", "请在全部联系人或常用联系人标签页中进行标记操作")
@@ -542,7 +547,10 @@ class ContactGUI:
             messagebox.showwarning("警告", "请输入搜索关键词")
             return
 
-        results = self.manager.search_by_name(search_term)
+        results = self.manager.search_by_name(search_term, limit=SEARCH_RESULT_LIMIT)
+        if not results:
+            # 没有精确匹配时按编辑距离容错搜索，应对输入错误
+            results = self.manager.search_fuzzy(search_term, limit=SEARCH_RESULT_LIMIT)
         self.show_search_results(results)
 
     def search_by_phone(self):
@@ -551,7 +559,7 @@ class ContactGUI:
             messagebox.showwarning("警告", "请输入搜索关键词")
             return
 
-        results = self.manager.search_by_phone(search_term)
+        results = self.manager.search_by_phone(search_term, limit=SEARCH_RESULT_LIMIT)
         self.show_search_results(results)
     
     def search_by_keypad(self):
@@ -565,53 +573,32 @@ class ContactGUI:
             messagebox.showwarning("警告", "九键搜索只能输入数字")
             return
         
-        results = self.manager.search_by_keypad(search_term)
+        results = self.manager.search_by_keypad(search_term, limit=SEARCH_RESULT_LIMIT)
         self.show_search_results(results)
     
     def unified_search(self, event=None):
-        """统一搜索功能：同时搜索姓名、电话、邮箱"""
+        """统一搜索功能：同时搜索姓名、电话、邮箱和九键序列"""
         search_term = self.search_var.get().strip()
         if not search_term:
             messagebox.showwarning("警告", "请输入搜索关键词")
             return
         
-        # 获取所有联系人
-        all_contacts = self.manager.get_all_contacts()
-        results = []
-        
-        # 统一搜索逻辑
-        search_term_lower = search_term.lower()
-        for contact in all_contacts:
-            # 搜索姓名
-            if search_term_lower in contact.name.lower():
-                results.append(contact)
-                continue
-            # 搜索电话
-            if search_term in contact.phone:
-                results.append(contact)
-                continue
-            # 搜索邮箱
-            if contact.email and search_term_lower in contact.email.lower():
-                results.append(contact)
-                continue
-            # 搜索九键编码
-            if search_term.isdigit():
-                # 检查九键编码是否匹配
-                keypad_code = self.manager.convert_to_keypad_code(contact.name.lower())
-                if search_term in keypad_code:
-                    results.append(contact)
-                    continue
-        
-        # 去除重复结果
-        unique_results = []
-        seen = set()
-        for contact in results:
-            if contact.phone not in seen:
-                seen.add(contact.phone)
-                unique_results.append(contact)
+        if is_structured_query(search_term):
+            # 字段:值 形式的结构化查询，例如 country:中国 frequent:yes name:li
+            try:
+                results = self.manager.query(search_term, limit=SEARCH_RESULT_LIMIT)
+            except QuerySyntaxError as e:
+                messagebox.showwarning("警告", f"查询语法错误: {e}")
+                return
+            self.show_search_results(results)
+            return
         
-        # 显示结果
-        self.show_search_results(unique_results)
+        # 匹配、排序和去重均由管理器基于搜索缓存完成
+        results = self.manager.unified_search(search_term, limit=SEARCH_RESULT_LIMIT)
+        if not results:
+            # 没有精确匹配时按编辑距离容错搜索姓名，应对输入错误
+            results = self.manager.search_fuzzy(search_term, limit=SEARCH_RESULT_LIMIT)
+        self.show_search_results(results)
 
     def show_search_results(self, results):
         # 根据当前标签页选择对应的Treeview
@@ -622,6 +609,11 @@ class ContactGUI:
         else:
             # 九键搜索标签页，不更新列表
             return
+        # 列表显示的是搜索结果，不再与全部数据一致
+        if current_tree is self.frequent_list:
+            self.frequent_list_synced = False
+        else:
+            self.contact_list_synced = False
         
         # 清空Treeview
         for item in current_tree.get_children():
@@ -629,11 +621,8 @@ class ContactGUI:
         
         self.current_contacts = results
         for contact in results:
-            status = "常用" if contact.is_frequent else ""
-            # 使用格式化后的电话号码
-            formatted_phone = contact.format_phone()
-            # 插入Treeview行
-            current_tree.insert('', tk.END, values=(status, contact.name, formatted_phone, contact.email))
+            # 插入Treeview行，使用联系人id作为iid
+            current_tree.insert('', tk.END, iid=contact.id, values=self._row_values(contact))
 
     def reset_search(self):
         self.search_var.set("")
@@ -269,27 +269,13 @@ class DataImporter:
             return False
         
         if success and contacts:
-            # 导入联系人到系统
-            imported_count = 0
-            duplicate_count = 0
-            
-            for contact in contacts:
-                # 检查电话号码是否已存在
-                phone_exists = False
-                for existing_contact in contact_manager.storage.contacts:
-                    if existing_contact.phone == contact.phone:
-                        phone_exists = True
-                        break
-                
-                if not phone_exists:
-                    result, msg = contact_manager.add_contact(contact)
-                    if result:
-                        imported_count += 1
-                    else:
-                        logger.warning(f"Failed to add imported contact: {msg}")
-                        duplicate_count += 1
-                else:
-                    duplicate_count += 1
+            # 批量导入联系人到系统：统一去重、只写盘一次并只更新一次索引
+            results = contact_manager.add_contacts(contacts)
+            imported_count = sum(1 for result, _ in results if result)
+            duplicate_count = len(results) - imported_count
+            for (result, msg), contact in zip(results, contacts):
+                if not result and msg != "该电话号码已存在":
+                    logger.warning(f"Failed to add imported contact {contact.phone}: {msg}")
             
             messagebox.showinfo(
                 "导入完成", 
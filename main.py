@@ -6,8 +6,8 @@ from gui.main_window import ContactGUI
 if __name__ == "__main__":
     root = tk.Tk()
     
-    # 初始化数据存储
-    storage = DataStorage()
+    # 初始化数据存储（启用日志模式，单次修改只追加一条记录；连续修改每秒最多写盘一次）
+    storage = DataStorage(use_journal=True, save_interval=1.0)
     
     # 初始化联系人管理器
     manager = ContactManager(storage)
@@ -16,7 +16,7 @@ if __name__ == "__main__":
     app = ContactGUI(root, storage, manager)
     
     # 设置窗口关闭事件处理
-    root.protocol("WM_DELETE_WINDOW", lambda: (storage.save_contacts(), root.destroy()))
+    root.protocol("WM_DELETE_WINDOW", lambda: (storage.close(), root.destroy()))
     
     # 启动主循环
     root.mainloop()
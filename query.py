@@ -0,0 +1,206 @@
+import re
+import shlex
+from typing import Any, Callable, List, Optional, Set
+from search_index import SearchEntry
+
+class QuerySyntaxError(ValueError):
+    """查询语句格式错误"""
+
+# 支持的字段；不带字段名的词按any处理，同时匹配姓名、电话和邮箱
+QUERY_FIELDS = ('name', 'phone', 'email', 'country', 'frequent', 'keypad', 'any')
+
+_FIELD_PATTERN = re.compile(r'(?:^|\s)(?:' + '|'.join(QUERY_FIELDS) + r'):', re.IGNORECASE)
+
+_TRUE_VALUES = {'yes', 'y', 'true', '1', '是'}
+_FALSE_VALUES = {'no', 'n', 'false', '0', '否'}
+
+class Predicate:
+    """查询条件：字段包含value，exact为True时要求字段等于value
+
+    country按国家/地区名称精确匹配，frequent为布尔值，keypad按词首九键序列前缀匹配。
+    """
+
+    def __init__(self, field: str, value: Any, exact: bool = False):
+        self.field = field
+        self.value = value
+        self.exact = exact
+
+    def __str__(self) -> str:
+        if self.field == 'frequent':
+            value = 'yes' if self.value else 'no'
+        else:
+            value = str(self.value)
+            if any(char.isspace() for char in value):
+                value = f'"{value}"'
+        return f"{self.field}:{'=' if self.exact else ''}{value}"
+
+    def __repr__(self) -> str:
+        return f"Predicate({str(self)!r})"
+
+    def matches(self, item: SearchEntry) -> bool:
+        """判断搜索缓存条目是否满足条件"""
+        field = self.field
+        value = self.value
+        if field == 'name':
+            return item.name_lower == value if self.exact else value in item.name_lower
+        if field == 'phone':
+            return item.phone == value if self.exact else value in item.phone
+        if field == 'email':
+            return item.email_lower == value if self.exact else value in item.email_lower
+        if field == 'country':
+            return item.country == value
+        if field == 'frequent':
+            return item.is_frequent == value
+        if field == 'keypad':
+            return any(sequence.startswith(value) for sequence in item.keypad_sequences)
+        texts = (item.name_lower, item.phone, item.email_lower)
+        if self.exact:
+            return value in texts
+        return any(value in text for text in texts)
+
+def _parse_value(field: str, raw: str) -> Any:
+    """校验并规范化字段值"""
+    if field in ('name', 'email', 'any'):
+        return raw.lower()
+    if field == 'frequent':
+        value = raw.lower()
+        if value in _TRUE_VALUES:
+            return True
+        if value in _FALSE_VALUES:
+            return False
+        raise QuerySyntaxError(f"Invalid value for frequent: {raw}")
+    if field == 'keypad' and not raw.isdigit():
+        raise QuerySyntaxError(f"Invalid value for keypad: {raw}")
+    return raw
+
+def is_structured_query(text: str) -> bool:
+    """判断文本中是否使用了 字段:值 形式的条件"""
+    return bool(_FIELD_PATTERN.search(text))
+
+def parse_query(text: str) -> List[Predicate]:
+    """解析形如 `country:中国 frequent:yes email:@qq.com name:li` 的查询语句
+
+    各条件之间为“与”关系；值中含空格时用引号括起，值以=开头表示精确匹配。
+    """
+    if not isinstance(text, str):
+        raise TypeError("query must be a string")
+    try:
+        tokens = shlex.split(text)
+    except ValueError as e:
+        raise QuerySyntaxError(f"Invalid query: {e}")
+
+    predicates = []
+    for token in tokens:
+        field, separator, raw = token.partition(':')
+        if not separator or field.lower() not in QUERY_FIELDS:
+            # 不是已知字段，整个词按any处理
+            field, raw = 'any', token
+        else:
+            field = field.lower()
+        exact = raw.startswith('=') and field in ('name', 'phone', 'email', 'any')
+        if exact:
+            raw = raw[1:]
+        raw = raw.strip()
+        if not raw:
+            raise QuerySyntaxError(f"Missing value for field: {field}")
+        predicates.append(Predicate(field, _parse_value(field, raw), exact))
+    return predicates
+
+class IndexAccess:
+    """可供查询规划器使用的二级索引
+
+    supports判断能否用于某个条件，estimate估计命中的联系人数，lookup返回命中的联系人键；
+    exact为False表示返回的是候选超集，仍需逐个复核条件。
+    """
+
+    def __init__(self, name: str, supports: Callable[[Predicate], bool],
+                 estimate: Callable[[Predicate], int], lookup: Callable[[Predicate], Set[str]],
+                 exact: bool = True):
+        self.name = name
+        self.supports = supports
+        self.estimate = estimate
+        self.lookup = lookup
+        self.exact = exact
+
+class PlanStep:
+    """查询计划中的一个条件及其访问方式"""
+
+    def __init__(self, predicate: Predicate, index: Optional[IndexAccess] = None,
+                 estimate: Optional[int] = None):
+        self.predicate = predicate
+        self.index = index
+        self.estimate = estimate
+
+class QueryPlan:
+    """查询计划：先用index_steps中的索引求候选集交集，再对候选逐个检查filters中的条件"""
+
+    def __init__(self, predicates: List[Predicate], total: int, index_steps: List[PlanStep],
+                 filter_steps: List[PlanStep], estimated_rows: int):
+        self.predicates = predicates
+        self.total = total
+        self.index_steps = index_steps
+        self.filter_steps = filter_steps
+        self.estimated_rows = estimated_rows
+
+    @property
+    def filters(self) -> List[Predicate]:
+        """需要对候选逐个检查的条件，包括只能给出候选超集的索引条件"""
+        checks = [step.predicate for step in self.index_steps if not step.index.exact]
+        checks.extend(step.predicate for step in self.filter_steps)
+        return checks
+
+    def explain(self) -> str:
+        """以文本形式描述查询计划和各步骤的估计行数"""
+        lines = [f"查询: {' '.join(str(predicate) for predicate in self.predicates)}",
+                 f"联系人总数: {self.total}"]
+        if self.index_steps:
+            for position, step in enumerate(self.index_steps):
+                action = "索引扫描" if position == 0 else "索引求交"
+                recheck = "，需复核" if not step.index.exact else ""
+                lines.append(f"{action}: {step.predicate} 使用 {step.index.name}（估计 {step.estimate} 行{recheck}）")
+        else:
+            lines.append("全量扫描")
+        for step in self.filter_steps:
+            if step.index is not None:
+                lines.append(f"过滤: {step.predicate}（索引 {step.index.name} 估计 {step.estimate} 行，选择性不足未使用）")
+            else:
+                lines.append(f"过滤: {step.predicate}")
+        lines.append(f"估计结果: {self.estimated_rows} 行")
+        return '\n'.join(lines)
+
+# 后续索引的估计行数不超过当前候选集的该倍数时才求交，否则直接对候选逐个检查更快
+INTERSECT_FACTOR = 4
+
+def plan_query(predicates: List[Predicate], indexes: List[IndexAccess], total: int) -> QueryPlan:
+    """为一组条件选择访问方式：选择性最高的索引先行，必要时与其他索引求交，其余条件逐个检查"""
+    indexed: List[PlanStep] = []
+    unindexed: List[PlanStep] = []
+    for predicate in predicates:
+        best: Optional[PlanStep] = None
+        for index in indexes:
+            if not index.supports(predicate):
+                continue
+            estimate = index.estimate(predicate)
+            # 估计相同时优先无需复核的索引
+            if best is None or (estimate, not index.exact) < (best.estimate, not best.index.exact):
+                best = PlanStep(predicate, index, estimate)
+        if best is None:
+            unindexed.append(PlanStep(predicate))
+        else:
+            indexed.append(best)
+
+    indexed.sort(key=lambda step: step.estimate)
+    index_steps: List[PlanStep] = []
+    filter_steps: List[PlanStep] = []
+    for step in indexed:
+        if not index_steps or step.estimate <= index_steps[0].estimate * INTERSECT_FACTOR:
+            index_steps.append(step)
+        else:
+            filter_steps.append(step)
+    filter_steps.extend(unindexed)
+
+    # 按条件相互独立估计结果行数，无法估计的条件不计入
+    estimated = float(total)
+    for step in indexed:
+        estimated *= step.estimate / total if total else 0
+    return QueryPlan(predicates, total, index_steps, filter_steps, int(round(estimated)))
@@ -0,0 +1,328 @@
+import re
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, NamedTuple, Set, Optional, Iterable, Tuple, Union
+
+def is_cjk(char: str) -> bool:
+    """判断字符是否为中日韩统一表意文字"""
+    return '\u4e00' <= char <= '\u9fff' or '\u3400' <= char <= '\u4dbf'
+
+def contains_cjk(text: str) -> bool:
+    """判断文本是否包含中日韩文字"""
+    return any(is_cjk(char) for char in text)
+
+# 匹配程度，数值越小相关度越高
+MATCH_EXACT = 0
+MATCH_PREFIX = 1
+MATCH_WORD_START = 2
+MATCH_SUBSTRING = 3
+
+def match_rank(text: str, term: str) -> Optional[int]:
+    """返回term在text中的匹配程度：完全相同、前缀、词首、子串，不包含时返回None"""
+    position = text.find(term)
+    if position < 0:
+        return None
+    if position == 0:
+        return MATCH_EXACT if len(text) == len(term) else MATCH_PREFIX
+    while position > 0:
+        if not text[position - 1].isalnum():
+            return MATCH_WORD_START
+        position = text.find(term, position + 1)
+    return MATCH_SUBSTRING
+
+def edit_distance(a: str, b: str) -> int:
+    """计算两个字符串的编辑距离，相邻字符交换算作一次编辑（受限Damerau-Levenshtein距离）"""
+    if a == b:
+        return 0
+    if not a or not b:
+        return len(a) or len(b)
+    previous2: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[-1]
+
+class SearchEntry(NamedTuple):
+    """单个联系人的搜索缓存条目
+
+    使用元组而不是字典保存，每个条目只占固定的几个指针，联系人数量很大时可显著减少内存。
+    """
+    contact: Any
+    name_lower: str
+    phone: str
+    email_lower: str
+    email_domain: str
+    country: str
+    is_frequent: bool
+    # 全拼和首字母两种九键序列，汉字按拼音转换
+    keypad_code: str
+    keypad_initials: str
+    keypad_sequences: Tuple[str, ...]
+    # 插入序号，用于让索引查询结果保持存储顺序
+    order: int
+
+class NGramIndex:
+    """名称子串搜索的n-gram倒排索引
+
+    所有名称按三元组（trigram）建立倒排表，包含中文的名称额外按二元组（bigram）
+    建立倒排表，以支持两个汉字的查询。查询时先求各倒排表的交集得到候选集，
+    再由调用方对候选逐一校验子串匹配。
+    """
+
+    def __init__(self):
+        """初始化空索引"""
+        self._postings: Dict[str, Set[str]] = {}
+
+    @staticmethod
+    def _ngrams(text: str, n: int) -> Set[str]:
+        """提取文本中所有长度为n的子串"""
+        return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+    def _grams_for_text(self, text: str) -> Set[str]:
+        """计算一个名称需要写入索引的全部n-gram"""
+        grams = self._ngrams(text, 3)
+        if contains_cjk(text):
+            grams |= self._ngrams(text, 2)
+        return grams
+
+    def _grams_for_query(self, query: str) -> Optional[Set[str]]:
+        """计算查询可用的n-gram，查询太短无法使用索引时返回None"""
+        if len(query) >= 3:
+            return self._ngrams(query, 3)
+        if len(query) == 2 and contains_cjk(query):
+            # 查询含中文时，匹配的名称也必然含中文，其二元组已写入索引
+            return {query}
+        return None
+
+    def add(self, key: str, text: str) -> None:
+        """将名称加入索引"""
+        for gram in self._grams_for_text(text):
+            self._postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key: str, text: str) -> None:
+        """从索引中移除名称，text必须与加入时一致"""
+        for gram in self._grams_for_text(text):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(key)
+                if not posting:
+                    del self._postings[gram]
+
+    def rebuild(self, items: Iterable[Tuple[str, str]]) -> None:
+        """根据 (key, text) 序列重建索引"""
+        self._postings.clear()
+        for key, text in items:
+            self.add(key, text)
+
+    def estimate(self, query: str) -> Optional[int]:
+        """估计候选集大小（最短倒排表的长度），无法使用索引时返回None"""
+        grams = self._grams_for_query(query)
+        if grams is None:
+            return None
+        return min(len(self._postings.get(gram, ())) for gram in grams)
+
+    def candidates(self, query: str) -> Optional[Set[str]]:
+        """返回可能包含query的候选键集合；无法使用索引时返回None，调用方需全量扫描"""
+        grams = self._grams_for_query(query)
+        if grams is None:
+            return None
+
+        postings = []
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if not posting:
+                return set()
+            postings.append(posting)
+
+        # 从最短的倒排表开始求交集，尽早缩小候选集
+        postings.sort(key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+
+class KeypadIndex:
+    """九键数字序列的有序索引
+
+    对每个名称中每个词首开始的数字序列（直到名称末尾）建立一条记录，按序列排序。
+    以词首开始的前缀匹配对应有序列表中的一段连续区间，可用二分查找定位；
+    在已有区间内继续追加数字时只需在该区间内二分，无需重新扫描。
+    """
+
+    def __init__(self):
+        """初始化空索引"""
+        # 两个平行列表，按 (序列, 键) 排序：_codes[i]为序列，_keys[i]为其所属的联系人键；
+        # 同一序列的记录按键排序，增删时可直接二分定位到某个联系人的记录
+        self._codes: List[str] = []
+        self._keys: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def _locate(self, code: str, key: str) -> int:
+        """二分查找 (code, key) 应在的位置：先定位序列相同的区间，再在区间内按键二分"""
+        lo = bisect_left(self._codes, code)
+        hi = bisect_right(self._codes, code, lo)
+        return bisect_left(self._keys, key, lo, hi)
+
+    def add(self, key: str, sequences: Iterable[str]) -> None:
+        """加入一个联系人的全部词首数字序列"""
+        for code in sequences:
+            index = self._locate(code, key)
+            self._codes.insert(index, code)
+            self._keys.insert(index, key)
+
+    def remove(self, key: str, sequences: Iterable[str]) -> None:
+        """移除一个联系人的全部词首数字序列，sequences必须与加入时一致"""
+        for code in sequences:
+            index = self._locate(code, key)
+            if index < len(self._codes) and self._codes[index] == code and self._keys[index] == key:
+                del self._codes[index]
+                del self._keys[index]
+
+    def rebuild(self, items: Iterable[Tuple[str, Iterable[str]]]) -> None:
+        """根据 (key, sequences) 序列重建索引"""
+        pairs = sorted((code, key) for key, sequences in items for code in sequences)
+        self._codes = [code for code, _ in pairs]
+        self._keys = [key for _, key in pairs]
+
+    def prefix_range(self, prefix: str, lo: int = 0, hi: Optional[int] = None) -> Tuple[int, int]:
+        """返回以prefix开头的记录区间[lo, hi)，可限定在已知的更短前缀区间内查找"""
+        if hi is None:
+            hi = len(self._codes)
+        # 数字之后的字符':'大于所有数字，作为前缀区间的上界
+        start = bisect_left(self._codes, prefix, lo, hi)
+        end = bisect_left(self._codes, prefix + ':', start, hi)
+        return start, end
+
+    def count_prefix(self, prefix: str) -> int:
+        """以prefix开头的记录数，即命中联系人数的上界"""
+        lo, hi = self.prefix_range(prefix)
+        return hi - lo
+
+    def keys_in_range(self, lo: int, hi: int) -> Set[str]:
+        """返回区间内的联系人键（去重）"""
+        return set(self._keys[lo:hi])
+
+class FuzzyIndex:
+    """名称中各个词的编辑距离索引（对称删除）
+
+    对每个不同的词预先生成删除至多max_distance个字符得到的全部变体。编辑距离不超过k的
+    两个词，各自删除至多k个字符后必有相同的变体，因此查询时只需查找查询词的删除变体，
+    再对少量候选计算编辑距离，无需与每个词逐一比较。
+    """
+
+    def __init__(self, max_distance: int = 2):
+        """初始化空索引，max_distance为支持的最大编辑距离"""
+        if not isinstance(max_distance, int) or max_distance < 0:
+            raise ValueError("max_distance must be a non-negative integer")
+        self.max_distance = max_distance
+        # 词 -> 包含该词的键
+        self._postings: Dict[str, Set[str]] = {}
+        # 删除变体 -> 原词；大多数变体只对应一个词，只有多个词时才使用列表以节省内存
+        self._deletes: Dict[str, Union[str, List[str]]] = {}
+
+    @staticmethod
+    def words(text: str) -> Set[str]:
+        """将文本切分为词"""
+        return set(re.findall(r'\w+', text))
+
+    @staticmethod
+    def _variants(word: str, distance: int) -> Set[str]:
+        """生成删除至多distance个字符得到的全部变体（含原词）"""
+        variants = {word}
+        frontier = {word}
+        for _ in range(distance):
+            frontier = {variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant))}
+            variants |= frontier
+        return variants
+
+    def _add_word(self, word: str) -> None:
+        """登记新词的删除变体"""
+        for variant in self._variants(word, self.max_distance):
+            existing = self._deletes.get(variant)
+            if existing is None:
+                self._deletes[variant] = word
+            elif isinstance(existing, str):
+                self._deletes[variant] = [existing, word]
+            else:
+                existing.append(word)
+
+    def _remove_word(self, word: str) -> None:
+        """撤销词的删除变体"""
+        for variant in self._variants(word, self.max_distance):
+            existing = self._deletes.get(variant)
+            if existing is None:
+                continue
+            if isinstance(existing, str):
+                if existing == word:
+                    del self._deletes[variant]
+            elif word in existing:
+                existing.remove(word)
+                if len(existing) == 1:
+                    self._deletes[variant] = existing[0]
+
+    def add(self, key: str, text: str) -> None:
+        """将文本中的词加入索引"""
+        for word in self.words(text):
+            posting = self._postings.get(word)
+            if posting is None:
+                posting = self._postings[word] = set()
+                self._add_word(word)
+            posting.add(key)
+
+    def remove(self, key: str, text: str) -> None:
+        """从索引中移除文本中的词，text必须与加入时一致"""
+        for word in self.words(text):
+            posting = self._postings.get(word)
+            if posting is None:
+                continue
+            posting.discard(key)
+            if not posting:
+                del self._postings[word]
+                self._remove_word(word)
+
+    def rebuild(self, items: Iterable[Tuple[str, str]]) -> None:
+        """根据 (key, text) 序列重建索引"""
+        self._postings.clear()
+        self._deletes.clear()
+        for key, text in items:
+            self.add(key, text)
+
+    def lookup(self, word: str, max_distance: int) -> Dict[str, int]:
+        """返回与word编辑距离不超过max_distance的已索引词及其距离"""
+        if max_distance > self.max_distance:
+            raise ValueError(f"max_distance must not exceed {self.max_distance}")
+        candidates: Set[str] = set()
+        for variant in self._variants(word, max_distance):
+            existing = self._deletes.get(variant)
+            if existing is None:
+                continue
+            if isinstance(existing, str):
+                candidates.add(existing)
+            else:
+                candidates.update(existing)
+        matches = {}
+        for candidate in candidates:
+            if abs(len(candidate) - len(word)) > max_distance:
+                continue
+            distance = edit_distance(word, candidate)
+            if distance <= max_distance:
+                matches[candidate] = distance
+        return matches
+
+    def search(self, word: str, max_distance: int) -> Dict[str, int]:
+        """返回包含与word近似的词的键，以及其中最小的编辑距离"""
+        distances: Dict[str, int] = {}
+        for match, distance in self.lookup(word, max_distance).items():
+            for key in self._postings[match]:
+                if distance < distances.get(key, max_distance + 1):
+                    distances[key] = distance
+        return distances
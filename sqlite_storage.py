@@ -0,0 +1,437 @@
+import os
+import sqlite3
+import logging
+import weakref
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Tuple, Iterator
+from contact import Contact, generate_contact_id
+from contacts_view import ContactsView
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 数据库结构版本，0表示尚未从JSON迁移；版本2增加联系人id列
+SCHEMA_VERSION = 2
+
+class SQLiteStorage:
+    """基于SQLite的联系人存储，与DataStorage接口一致
+
+    每次增删改只执行一条按联系人id定位的SQL语句，id、电话号码唯一索引和姓名索引
+    使查找和修改的代价为O(log n)，无需重写整个文件。
+    """
+
+    def __init__(self, db_path: str = "contacts.db", json_path: Optional[str] = "contacts.json"):
+        """初始化SQLite存储，首次打开时从json_path一次性迁移已有数据"""
+        if not isinstance(db_path, str):
+            raise TypeError("db_path must be a string")
+        if json_path is not None and not isinstance(json_path, str):
+            raise TypeError("json_path must be a string or None")
+
+        self.file_path: str = db_path
+        self.json_path: Optional[str] = json_path
+        self.contacts: List[Contact] = []
+        # 最近一次发出的只读快照，仍被引用时修改contacts前需先复制列表
+        self._snapshot_ref: Optional['weakref.ReferenceType[ContactsView]'] = None
+        # 数据库行号到内存联系人对象的映射
+        self._contacts_by_rowid: Dict[int, Contact] = {}
+        # 进行中的事务层数，事务中的写入在最外层事务结束时才提交
+        self._transaction_depth: int = 0
+
+        try:
+            dir_path = os.path.dirname(db_path)
+            if dir_path and not os.path.exists(dir_path):
+                logger.info(f"Creating directory {dir_path} for contacts storage")
+                os.makedirs(dir_path, exist_ok=True)
+            self.conn = sqlite3.connect(db_path)
+            self._create_schema()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to open database {db_path}: {e}")
+            raise OSError(f"Failed to open database {db_path}: {e}")
+
+        if json_path is not None and self._get_schema_version() == 0:
+            self.migrate_from_json(json_path)
+
+        self.load_contacts()
+
+    def _create_schema(self) -> None:
+        """创建数据表和索引"""
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS contacts ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "name TEXT NOT NULL, "
+                "phone TEXT NOT NULL UNIQUE, "
+                "email TEXT NOT NULL DEFAULT '', "
+                "remark TEXT NOT NULL DEFAULT '', "
+                "is_frequent INTEGER NOT NULL DEFAULT 0, "
+                "uid TEXT)"
+            )
+            # 版本1的数据库没有uid列，补充该列并为已有行生成id
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(contacts)")}
+            if "uid" not in columns:
+                self.conn.execute("ALTER TABLE contacts ADD COLUMN uid TEXT")
+            missing = self.conn.execute("SELECT id FROM contacts WHERE uid IS NULL").fetchall()
+            self.conn.executemany(
+                "UPDATE contacts SET uid = ? WHERE id = ?",
+                [(generate_contact_id(), rowid) for (rowid,) in missing]
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_contacts_name ON contacts(name)")
+            self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_contacts_uid ON contacts(uid)")
+            if 0 < self._get_schema_version() < SCHEMA_VERSION:
+                self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _get_schema_version(self) -> int:
+        """读取数据库结构版本"""
+        return self.conn.execute("PRAGMA user_version").fetchone()[0]
+
+    @staticmethod
+    def _to_row(contact: Contact) -> Tuple[str, str, str, str, int, str]:
+        """将联系人转换为数据库行"""
+        return (contact.name, contact.phone, contact.email, contact.remark, int(contact.is_frequent), contact.id)
+
+    def migrate_from_json(self, json_path: str) -> int:
+        """从JSON快照（含未合并的日志）一次性迁移联系人，返回迁移数量"""
+        from storage import DataStorage
+
+        if not os.path.isfile(json_path):
+            logger.info(f"No JSON file {json_path} to migrate, starting with an empty database")
+            with self.conn:
+                self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            return 0
+
+        source = DataStorage(json_path)
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO contacts (name, phone, email, remark, is_frequent, uid) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [self._to_row(contact) for contact in source.contacts]
+                )
+                self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        except sqlite3.Error as e:
+            logger.error(f"Failed to migrate contacts from {json_path}: {e}")
+            raise OSError(f"Failed to migrate contacts from {json_path}: {e}")
+
+        logger.info(f"Migrated {len(source.contacts)} contacts from {json_path} to {self.file_path}")
+        return len(source.contacts)
+
+    def load_contacts(self) -> None:
+        """从数据库加载联系人"""
+        # 换用新列表，已发出的快照保持原有内容
+        self.contacts = []
+        self._snapshot_ref = None
+        self._contacts_by_rowid.clear()
+
+        invalid_contacts_count = 0
+        try:
+            rows = self.conn.execute(
+                "SELECT id, name, phone, email, remark, is_frequent, uid FROM contacts ORDER BY id"
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to read database {self.file_path}: {e}")
+            raise OSError(f"Failed to read database {self.file_path}: {e}")
+
+        for rowid, name, phone, email, remark, is_frequent, uid in rows:
+            try:
+                contact = Contact(name, phone, email, remark, bool(is_frequent), uid)
+            except ValueError as e:
+                logger.warning(f"Skipping invalid contact data: {e}")
+                invalid_contacts_count += 1
+                continue
+            self.contacts.append(contact)
+            self._contacts_by_rowid[rowid] = contact
+
+        if invalid_contacts_count > 0:
+            logger.warning(f"Loaded {len(self.contacts)} contacts, skipped {invalid_contacts_count} invalid entries")
+        else:
+            logger.info(f"Successfully loaded {len(self.contacts)} contacts from {self.file_path}")
+
+    def snapshot(self) -> ContactsView:
+        """返回联系人列表的只读快照，不复制列表；之后通过本类方法进行的修改不会影响快照"""
+        view = self._snapshot_ref() if self._snapshot_ref is not None else None
+        if view is None:
+            view = ContactsView(self.contacts)
+            self._snapshot_ref = weakref.ref(view)
+        return view
+
+    def _detach_snapshot(self) -> None:
+        """修改contacts列表前调用：已发出的快照仍被引用时先复制列表（写时复制）"""
+        if self._snapshot_ref is not None and self._snapshot_ref() is not None:
+            self.contacts = list(self.contacts)
+        self._snapshot_ref = None
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        """单次写入的上下文：不在事务中时立即提交，出错时回滚"""
+        if self._transaction_depth:
+            yield
+        else:
+            with self.conn:
+                yield
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """将一组修改合并为一个数据库事务，发生异常时回滚并恢复内存中的联系人列表"""
+        if self._transaction_depth:
+            # 嵌套的事务并入最外层事务
+            self._transaction_depth += 1
+            try:
+                yield
+            finally:
+                self._transaction_depth -= 1
+            return
+
+        saved = self.snapshot()
+        self._transaction_depth = 1
+        try:
+            yield
+            self._transaction_depth = 0
+            self.conn.commit()
+        except BaseException as e:
+            self._transaction_depth = 0
+            self.conn.rollback()
+            self.contacts = list(saved)
+            self._snapshot_ref = None
+            contacts_by_id = {contact.id: contact for contact in self.contacts}
+            self._contacts_by_rowid = {
+                rowid: contacts_by_id[uid]
+                for rowid, uid in self.conn.execute("SELECT id, uid FROM contacts")
+                if uid in contacts_by_id
+            }
+            logger.warning("Transaction rolled back, no changes were written")
+            if isinstance(e, sqlite3.Error):
+                raise OSError(f"Failed to commit transaction to {self.file_path}: {e}")
+            raise
+
+    def save_contacts(self) -> None:
+        """将内存中的联系人完整同步到数据库
+
+        通过add_contact等方法进行的修改已逐行写入，这里只处理直接修改contacts列表的情况。
+        """
+        try:
+            with self._writing():
+                current_ids = {contact.id for contact in self.contacts}
+                stale = [(uid,) for (uid,) in self.conn.execute("SELECT uid FROM contacts")
+                         if uid not in current_ids]
+                self.conn.executemany("DELETE FROM contacts WHERE uid = ?", stale)
+                self.conn.executemany(
+                    "INSERT INTO contacts (name, phone, email, remark, is_frequent, uid) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(uid) DO UPDATE SET name = excluded.name, phone = excluded.phone, "
+                    "email = excluded.email, remark = excluded.remark, is_frequent = excluded.is_frequent",
+                    [self._to_row(contact) for contact in self.contacts]
+                )
+
+            contacts_by_id = {contact.id: contact for contact in self.contacts}
+            self._contacts_by_rowid = {
+                rowid: contacts_by_id[uid]
+                for rowid, uid in self.conn.execute("SELECT id, uid FROM contacts")
+            }
+            logger.info(f"Successfully saved {len(self.contacts)} contacts to {self.file_path}")
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write database {self.file_path}: {e}")
+            raise OSError(f"Failed to write database {self.file_path}: {e}")
+
+    def _find_rowid(self, phone: str) -> Optional[int]:
+        """通过电话号码索引查找行号"""
+        row = self.conn.execute("SELECT id FROM contacts WHERE phone = ?", (phone,)).fetchone()
+        return row[0] if row else None
+
+    def _find_rowid_by_uid(self, contact_id: str) -> Optional[int]:
+        """通过联系人id索引查找行号"""
+        row = self.conn.execute("SELECT id FROM contacts WHERE uid = ?", (contact_id,)).fetchone()
+        return row[0] if row else None
+
+    def add_contact(self, contact: Contact) -> None:
+        """添加联系人"""
+        if not isinstance(contact, Contact):
+            raise TypeError("contact must be an instance of Contact")
+        try:
+            with self._writing():
+                cursor = self.conn.execute(
+                    "INSERT INTO contacts (name, phone, email, remark, is_frequent, uid) VALUES (?, ?, ?, ?, ?, ?)",
+                    self._to_row(contact)
+                )
+        except sqlite3.IntegrityError as e:
+            logger.error(f"Duplicate phone when adding contact {contact.phone}: {e}")
+            raise ValueError(f"Phone already exists: {contact.phone}")
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write database {self.file_path}: {e}")
+            raise OSError(f"Failed to write database {self.file_path}: {e}")
+        self._detach_snapshot()
+        self.contacts.append(contact)
+        self._contacts_by_rowid[cursor.lastrowid] = contact
+
+    def update_contact(self, index: int, contact: Contact) -> None:
+        """更新联系人"""
+        if not isinstance(contact, Contact):
+            raise TypeError("contact must be an instance of Contact")
+        if not 0 <= index < len(self.contacts):
+            raise IndexError("Invalid contact index")
+        old_contact = self.contacts[index]
+        try:
+            rowid = self._find_rowid_by_uid(old_contact.id)
+            with self._writing():
+                if rowid is None:
+                    cursor = self.conn.execute(
+                        "INSERT INTO contacts (name, phone, email, remark, is_frequent, uid) VALUES (?, ?, ?, ?, ?, ?)",
+                        self._to_row(contact)
+                    )
+                    rowid = cursor.lastrowid
+                else:
+                    self.conn.execute(
+                        "UPDATE contacts SET name = ?, phone = ?, email = ?, remark = ?, is_frequent = ?, uid = ? "
+                        "WHERE id = ?",
+                        self._to_row(contact) + (rowid,)
+                    )
+        except sqlite3.IntegrityError as e:
+            logger.error(f"Duplicate phone when updating contact {contact.phone}: {e}")
+            raise ValueError(f"Phone already exists: {contact.phone}")
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write database {self.file_path}: {e}")
+            raise OSError(f"Failed to write database {self.file_path}: {e}")
+        self._detach_snapshot()
+        self.contacts[index] = contact
+        self._contacts_by_rowid[rowid] = contact
+
+    def delete_contact(self, index: int) -> None:
+        """删除联系人"""
+        if not 0 <= index < len(self.contacts):
+            raise IndexError("Invalid contact index")
+        contact = self.contacts[index]
+        try:
+            rowid = self._find_rowid_by_uid(contact.id)
+            if rowid is not None:
+                with self._writing():
+                    self.conn.execute("DELETE FROM contacts WHERE id = ?", (rowid,))
+                self._contacts_by_rowid.pop(rowid, None)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write database {self.file_path}: {e}")
+            raise OSError(f"Failed to write database {self.file_path}: {e}")
+        self._detach_snapshot()
+        del self.contacts[index]
+
+    def add_contacts(self, contacts: List[Contact]) -> None:
+        """在一个事务中批量添加联系人"""
+        for contact in contacts:
+            if not isinstance(contact, Contact):
+                raise TypeError("contact must be an instance of Contact")
+        if not contacts:
+            return
+        try:
+            with self._writing():
+                self.conn.executemany(
+                    "INSERT INTO contacts (name, phone, email, remark, is_frequent, uid) VALUES (?, ?, ?, ?, ?, ?)",
+                    [self._to_row(contact) for contact in contacts]
+                )
+                rowids = self._rowids_by_uid([contact.id for contact in contacts])
+        except sqlite3.IntegrityError as e:
+            logger.error(f"Duplicate phone when adding {len(contacts)} contacts: {e}")
+            raise ValueError(f"Phone already exists: {e}")
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write database {self.file_path}: {e}")
+            raise OSError(f"Failed to write database {self.file_path}: {e}")
+        self._detach_snapshot()
+        self.contacts.extend(contacts)
+        for contact in contacts:
+            self._contacts_by_rowid[rowids[contact.id]] = contact
+
+    def update_contacts(self, updates: List[Tuple[int, Contact]]) -> None:
+        """在一个事务中批量更新联系人，updates为 (位置, 新联系人) 列表"""
+        for index, contact in updates:
+            if not isinstance(contact, Contact):
+                raise TypeError("contact must be an instance of Contact")
+            if not 0 <= index < len(self.contacts):
+                raise IndexError("Invalid contact index")
+        if not updates:
+            return
+        try:
+            with self._writing():
+                rowids = self._rowids_by_uid([self.contacts[index].id for index, _ in updates])
+                # 先释放本批次涉及的电话号码，避免互换号码时违反唯一约束
+                self.conn.executemany(
+                    "UPDATE contacts SET phone = '#' || id WHERE id = ?",
+                    [(rowids[self.contacts[index].id],) for index, _ in updates]
+                )
+                self.conn.executemany(
+                    "UPDATE contacts SET name = ?, phone = ?, email = ?, remark = ?, is_frequent = ?, uid = ? "
+                    "WHERE id = ?",
+                    [self._to_row(contact) + (rowids[self.contacts[index].id],) for index, contact in updates]
+                )
+        except sqlite3.IntegrityError as e:
+            logger.error(f"Duplicate phone when updating {len(updates)} contacts: {e}")
+            raise ValueError(f"Phone already exists: {e}")
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write database {self.file_path}: {e}")
+            raise OSError(f"Failed to write database {self.file_path}: {e}")
+        self._detach_snapshot()
+        for index, contact in updates:
+            rowid = rowids[self.contacts[index].id]
+            self.contacts[index] = contact
+            self._contacts_by_rowid[rowid] = contact
+
+    def delete_contacts(self, indices: List[int]) -> None:
+        """在一个事务中批量删除联系人"""
+        for index in indices:
+            if not 0 <= index < len(self.contacts):
+                raise IndexError("Invalid contact index")
+        removed = set(indices)
+        if not removed:
+            return
+        try:
+            with self._writing():
+                rowids = self._rowids_by_uid([self.contacts[index].id for index in removed])
+                self.conn.executemany("DELETE FROM contacts WHERE id = ?", [(rowid,) for rowid in rowids.values()])
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write database {self.file_path}: {e}")
+            raise OSError(f"Failed to write database {self.file_path}: {e}")
+        for rowid in rowids.values():
+            self._contacts_by_rowid.pop(rowid, None)
+        # 直接换用新列表，已发出的快照不受影响
+        self.contacts = [contact for index, contact in enumerate(self.contacts) if index not in removed]
+        self._snapshot_ref = None
+
+    def _rowids_by_uid(self, contact_ids: List[str]) -> Dict[str, int]:
+        """批量通过联系人id索引查找行号"""
+        rowids: Dict[str, int] = {}
+        # 分批查询，避免超过SQLite单条语句的参数个数上限
+        for start in range(0, len(contact_ids), 500):
+            chunk = contact_ids[start:start + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            rowids.update(
+                (uid, rowid) for rowid, uid in
+                self.conn.execute(f"SELECT id, uid FROM contacts WHERE uid IN ({placeholders})", chunk)
+            )
+        return rowids
+
+    def get_contact_by_phone(self, phone: str) -> Optional[Contact]:
+        """根据电话号码查找联系人（使用唯一索引）"""
+        if not isinstance(phone, str):
+            raise TypeError("phone must be a string")
+        rowid = self._find_rowid(phone)
+        if rowid is None:
+            return None
+        return self._contacts_by_rowid.get(rowid)
+
+    def clear_contacts(self) -> None:
+        """清空所有联系人"""
+        try:
+            with self._writing():
+                self.conn.execute("DELETE FROM contacts")
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write database {self.file_path}: {e}")
+            raise OSError(f"Failed to write database {self.file_path}: {e}")
+        self.contacts = []
+        self._snapshot_ref = None
+        self._contacts_by_rowid.clear()
+
+    def get_contacts_count(self) -> int:
+        """获取联系人数量"""
+        return len(self.contacts)
+
+    def flush(self) -> None:
+        """所有修改均已逐行提交，无需额外写入"""
+        self.conn.commit()
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        self.conn.close()
@@ -1,29 +1,99 @@
 import json
 import os
+import atexit
+import hashlib
 import logging
-from typing import List, Dict, Any, Optional
-from contact import Contact
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import List, Dict, Set, Any, Optional, Tuple, Iterator
+from contact import Contact, generate_contact_id
+from contacts_view import ContactsView
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class DataStorage:
-    def __init__(self, file_path: str = "contacts.json"):
-        """初始化数据存储"""
+    def __init__(self, file_path: str = "contacts.json", use_journal: bool = False,
+                 compact_threshold_bytes: int = 1024 * 1024, compact_max_age: float = 600.0,
+                 save_interval: Optional[float] = None):
+        """初始化数据存储
+
+        use_journal 为 True 时，增删改操作以追加记录的方式写入快照旁的日志文件，
+        写入代价与通讯录规模无关；加载时在最近一次快照之上重放日志。
+        日志超过 compact_threshold_bytes 字节，或距上次检查点超过 compact_max_age 秒时，
+        在后台线程中生成新的快照并清理日志。
+        设置 save_interval（秒）后，修改只标记为待写入，由后台定时器合并写盘，
+        每个间隔内最多写入一次；需要立即落盘时调用 flush()，退出前调用 close()。
+        """
         if not isinstance(file_path, str):
             raise TypeError("file_path must be a string")
+        if compact_threshold_bytes <= 0:
+            raise ValueError("compact_threshold_bytes must be positive")
+        if compact_max_age <= 0:
+            raise ValueError("compact_max_age must be positive")
+        if save_interval is not None and save_interval <= 0:
+            raise ValueError("save_interval must be positive")
         
         self.file_path: str = file_path
+        self.journal_path: str = f"{file_path}.journal"
+        # 快照内容的SHA-256校验和，与快照一致时加载可跳过逐条校验
+        self.checksum_path: str = f"{file_path}.sha256"
+        # 压缩进行中时，已并入新快照的日志被轮转到此文件
+        self.compacting_journal_path: str = f"{file_path}.journal.old"
+        self.use_journal: bool = use_journal
+        self.compact_threshold_bytes: int = compact_threshold_bytes
+        self.compact_max_age: float = compact_max_age
+        self.save_interval: Optional[float] = save_interval
         self.contacts: List[Contact] = []
+        # 最近一次发出的只读快照，仍被引用时修改contacts前需先复制列表
+        self._snapshot_ref: Optional['weakref.ReferenceType[ContactsView]'] = None
+        # 电话号码到联系人的哈希索引，由所有修改路径同步维护
+        self._phone_index: Dict[str, Contact] = {}
+        # 最近一次压缩的统计信息：耗时（秒）、回收字节数等
+        self.last_compaction_stats: Optional[Dict[str, Any]] = None
+        
+        self._lock = threading.RLock()
+        self._compaction_thread: Optional[threading.Thread] = None
+        self._last_checkpoint: float = time.monotonic()
+        # 脏数据跟踪：每次修改递增代数，保存时记录已落盘的代数和内容摘要
+        self._generation: int = 0
+        self._saved_generation: int = 0
+        self._saved_count: int = 0
+        self._saved_digest: Optional[str] = None
+        # 合并写入：尚未写入日志的记录、待触发的定时器和上次写盘时间
+        self._pending_records: List[Dict[str, Any]] = []
+        self._save_timer: Optional[threading.Timer] = None
+        self._last_flush: float = 0.0
+        # 保证多次写入按顺序执行；后台压缩线程不会获取此锁
+        self._flush_lock = threading.Lock()
+        # 进行中的事务累积的修改记录，不在事务中时为None；事务中需要整体保存时置位
+        self._transaction_records: Optional[List[Dict[str, Any]]] = None
+        self._transaction_needs_save: bool = False
         self.load_contacts()
+        
+        if save_interval is not None:
+            # 进程退出时仍要写入合并中的修改
+            atexit.register(self.flush)
 
     def load_contacts(self) -> None:
         """加载联系人数据"""
-        self.contacts.clear()
+        self.wait_for_compaction()
+        # 换用新列表，已发出的快照保持原有内容
+        self.contacts = []
+        self._snapshot_ref = None
+        self._phone_index.clear()
+        self._last_checkpoint = time.monotonic()
+        self._mark_clean(None)
         
         if not os.path.exists(self.file_path):
             logger.info(f"File {self.file_path} does not exist, initializing empty contacts list")
+            # 磁盘上还没有快照，首次保存时需要写入
+            self.mark_dirty()
+            self._replay_journals()
+            self.rebuild_phone_index()
             return
         
         if not os.path.isfile(self.file_path):
@@ -32,26 +102,53 @@ class DataStorage:
         
         try:
             with open(self.file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
+                text = f.read()
+            digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            # 快照由本程序写入且未被改动过时，其中的联系人已通过校验，无需再次校验
+            trusted = digest == self._read_checksum()
+            data = json.loads(text)
                 
             if not isinstance(data, list):
                 logger.error(f"Invalid data format in {self.file_path}: expected a list of contacts")
                 raise ValueError("Invalid data format: expected a list of contacts")
             
             invalid_contacts_count = 0
+            generated_ids_count = 0
+            seen_ids: Set[str] = set()
             for contact_data in data:
                 try:
-                    contact = Contact.from_dict(contact_data)
-                    self.contacts.append(contact)
-                except (TypeError, ValueError) as e:
+                    if trusted:
+                        contact = Contact.from_trusted_dict(contact_data)
+                    else:
+                        contact = Contact.from_dict(contact_data)
+                except (TypeError, ValueError, KeyError) as e:
                     logger.warning(f"Skipping invalid contact data: {e}")
                     invalid_contacts_count += 1
                     continue
+                # 旧数据缺少id或id重复时分配新的id，并在下次保存时写回
+                if "id" not in contact_data or contact.id in seen_ids:
+                    contact.id = generate_contact_id()
+                    generated_ids_count += 1
+                seen_ids.add(contact.id)
+                self.contacts.append(contact)
+            
+            if generated_ids_count > 0:
+                logger.info(f"Assigned new ids to {generated_ids_count} contacts from {self.file_path}")
+                self.mark_dirty()
             
             if invalid_contacts_count > 0:
                 logger.warning(f"Loaded {len(self.contacts)} contacts, skipped {invalid_contacts_count} invalid entries")
+                # 重新保存时会丢弃无效条目，内存与磁盘内容不一致
+                self.mark_dirty()
             else:
-                logger.info(f"Successfully loaded {len(self.contacts)} contacts from {self.file_path}")
+                logger.info(f"Successfully loaded {len(self.contacts)} contacts from {self.file_path}"
+                            + ("" if trusted else " (validated)"))
+            self._saved_count = len(self.contacts)
+            self._saved_digest = digest
+            
+            # 在快照之上重放日志（即使未启用日志模式，也不能丢弃已有日志中的修改）
+            self._replay_journals()
+            self.rebuild_phone_index()
                 
         except json.JSONDecodeError as e:
             logger.error(f"Invalid JSON format in {self.file_path}: {e}")
@@ -66,26 +163,128 @@ class DataStorage:
             logger.error(f"Unexpected error when loading contacts: {e}", exc_info=True)
             raise Exception(f"Failed to load contacts: {e}")
 
-    def save_contacts(self) -> None:
-        """保存联系人数据"""
-        try:
-            # 确保目录存在
-            dir_path = os.path.dirname(self.file_path)
-            if dir_path and not os.path.exists(dir_path):
-                logger.info(f"Creating directory {dir_path} for contacts storage")
-                os.makedirs(dir_path, exist_ok=True)
-            
-            # 准备数据
-            data: List[Dict[str, Any]] = [contact.to_dict() for contact in self.contacts]
-            
-            # 先写入临时文件，再重命名，确保原子操作
-            temp_file_path = f"{self.file_path}.tmp"
-            with open(temp_file_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-            
-            # 替换原文件
+    def snapshot(self) -> ContactsView:
+        """返回联系人列表的只读快照，不复制列表；之后通过本类方法进行的修改不会影响快照"""
+        with self._lock:
+            view = self._snapshot_ref() if self._snapshot_ref is not None else None
+            if view is None:
+                view = ContactsView(self.contacts, self._generation)
+                self._snapshot_ref = weakref.ref(view)
+            return view
+    
+    def _detach_snapshot(self) -> None:
+        """修改contacts列表前调用：已发出的快照仍被引用时先复制列表（写时复制）"""
+        if self._snapshot_ref is not None and self._snapshot_ref() is not None:
+            self.contacts = list(self.contacts)
+        self._snapshot_ref = None
+    
+    def mark_dirty(self) -> None:
+        """标记内存数据已修改；直接修改contacts中的对象后需调用此方法"""
+        with self._lock:
+            self._generation += 1
+    
+    @property
+    def generation(self) -> int:
+        """修改代数：每次修改内存中的联系人都会递增，上层缓存据此判断是否失效"""
+        return self._generation
+    
+    def is_dirty(self) -> bool:
+        """内存数据是否可能与磁盘快照不一致"""
+        return self._generation != self._saved_generation or len(self.contacts) != self._saved_count
+    
+    def _mark_clean(self, digest: Optional[str], generation: Optional[int] = None,
+                    count: Optional[int] = None) -> None:
+        """记录已落盘的代数、联系人数量和内容摘要"""
+        self._saved_generation = self._generation if generation is None else generation
+        self._saved_count = len(self.contacts) if count is None else count
+        self._saved_digest = digest
+    
+    @staticmethod
+    def _serialize(contacts: List[Contact]) -> Tuple[str, str]:
+        """将联系人列表序列化为JSON文本，并计算内容摘要"""
+        data: List[Dict[str, Any]] = [contact.to_dict() for contact in contacts]
+        text = json.dumps(data, ensure_ascii=False, indent=4)
+        return text, hashlib.sha256(text.encode("utf-8")).hexdigest()
+    
+    def _disk_digest(self) -> Optional[str]:
+        """计算磁盘快照的内容摘要，文件不存在时返回None"""
+        if self._saved_digest is None and os.path.isfile(self.file_path):
+            with open(self.file_path, "rb") as f:
+                self._saved_digest = hashlib.sha256(f.read()).hexdigest()
+        return self._saved_digest
+    
+    def _read_checksum(self) -> Optional[str]:
+        """读取快照的校验和文件，不存在或无法读取时返回None"""
+        try:
+            with open(self.checksum_path, "r", encoding="utf-8") as f:
+                return f.read().strip()
+        except OSError:
+            return None
+    
+    def _write_checksum(self, digest: str) -> None:
+        """原子写入快照的校验和文件"""
+        temp_file_path = f"{self.checksum_path}.tmp"
+        with open(temp_file_path, "w", encoding="utf-8") as f:
+            f.write(digest)
+        os.replace(temp_file_path, self.checksum_path)
+    
+    def _write_snapshot(self, text: str, temp_file_path: str, digest: str) -> None:
+        """将序列化后的快照写入临时文件，再原子替换快照文件，最后更新校验和
+
+        替换快照后、更新校验和前中断时两者不一致，下次加载会逐条校验，不会误信快照。
+        """
+        # 确保目录存在
+        dir_path = os.path.dirname(self.file_path)
+        if dir_path and not os.path.exists(dir_path):
+            logger.info(f"Creating directory {dir_path} for contacts storage")
+            os.makedirs(dir_path, exist_ok=True)
+        
+        # 先写入临时文件，再重命名，确保原子操作
+        with open(temp_file_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        
+        # 替换原文件
+        with self._lock:
             os.replace(temp_file_path, self.file_path)
-            logger.info(f"Successfully saved {len(self.contacts)} contacts to {self.file_path}")
+            self._write_checksum(digest)
+
+    def save_contacts(self, force: bool = False) -> None:
+        """保存联系人数据
+
+        内存数据自上次保存后未修改时直接返回；修改后又恢复原状（内容摘要与磁盘一致）时
+        只清理日志，不重写快照。force 为 True 时总是写入。
+        """
+        if self._transaction_records is not None:
+            # 事务中推迟到提交时再保存
+            self._transaction_needs_save = True
+            return
+        try:
+            # 等待进行中的后台压缩结束，避免旧快照覆盖新快照
+            self.wait_for_compaction()
+            
+            with self._lock:
+                # 完整快照包含所有修改，等待合并写入的日志记录不再需要
+                self._pending_records.clear()
+                if not force and not self.is_dirty():
+                    logger.debug(f"No changes since last save, skipping write to {self.file_path}")
+                    return
+                
+                generation = self._generation
+                text, digest = self._serialize(self.contacts)
+                if not force and digest == self._disk_digest():
+                    logger.info(f"Contacts unchanged on disk, skipping write to {self.file_path}")
+                    if self._read_checksum() != digest:
+                        self._write_checksum(digest)
+                else:
+                    self._write_snapshot(text, f"{self.file_path}.tmp", digest)
+                    logger.info(f"Successfully saved {len(self.contacts)} contacts to {self.file_path}")
+                
+                # 快照已包含全部修改，日志可以清空
+                for path in (self.compacting_journal_path, self.journal_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                self._last_checkpoint = time.monotonic()
+                self._mark_clean(digest, generation)
             
         except PermissionError as e:
             logger.error(f"Permission denied when writing {self.file_path}: {e}")
@@ -97,41 +296,528 @@ class DataStorage:
             logger.error(f"Unexpected error when saving contacts: {e}", exc_info=True)
             raise Exception(f"Failed to save contacts: {e}")
     
+    def _append_journal(self, records: List[Dict[str, Any]]) -> None:
+        """将修改记录追加到日志文件，每条记录占一行"""
+        try:
+            lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+            with self._lock:
+                with open(self.journal_path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+            logger.debug(f"Appended {len(records)} record(s) to {self.journal_path}")
+        except PermissionError as e:
+            logger.error(f"Permission denied when writing {self.journal_path}: {e}")
+            raise PermissionError(f"Permission denied when writing {self.journal_path}: {e}")
+        except OSError as e:
+            logger.error(f"OS error when writing {self.journal_path}: {e}")
+            raise OSError(f"Failed to write file {self.journal_path}: {e}")
+    
+    def _persist(self, records: List[Dict[str, Any]]) -> None:
+        """持久化一次修改：日志模式下追加记录，否则重写整个快照
+
+        启用合并写入时只缓存记录并安排后台写入；事务中只累积记录，提交时统一写入。
+        """
+        if self._transaction_records is not None:
+            self._transaction_records.extend(records)
+        elif self.save_interval is not None:
+            with self._lock:
+                if self.use_journal:
+                    self._pending_records.extend(records)
+                self._schedule_flush()
+        elif self.use_journal:
+            self._append_journal(records)
+            self._maybe_compact()
+        else:
+            self.save_contacts()
+    
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """将一组修改合并为一次持久化
+
+        事务中的增删改立即作用于内存，退出时一次性写入：日志模式下作为一条记录追加，
+        写入不完整时整条跳过；否则只重写一次快照。发生异常或提交时写入失败，都恢复事务
+        开始时的联系人列表，不写入任何事务中的修改。嵌套的事务并入最外层事务。
+        """
+        with self._lock:
+            if self._transaction_records is not None:
+                nested = True
+            else:
+                nested = False
+                # 快照保证事务开始时的列表不会被事务中的修改改动
+                saved = self.snapshot()
+                self._transaction_records = []
+                self._transaction_needs_save = False
+        if nested:
+            yield
+            return
+        
+        try:
+            yield
+        except BaseException:
+            self._rollback_transaction(saved)
+            raise
+        
+        with self._lock:
+            records = self._transaction_records
+            needs_save = self._transaction_needs_save
+            self._transaction_records = None
+            self._transaction_needs_save = False
+        try:
+            if needs_save:
+                self.save_contacts()
+            elif len(records) == 1:
+                self._persist(records)
+            elif records:
+                self._persist([{"op": "batch", "records": records}])
+        except Exception:
+            self._rollback_transaction(saved, needs_save)
+            raise
+    
+    def _rollback_transaction(self, saved: ContactsView, needs_save: bool = False) -> None:
+        """恢复事务开始时的联系人列表
+        
+        事务中被推迟的保存请求（例如定时器在事务中触发）可能包含事务开始前已提交的修改，
+        回滚后重新安排写入，不随事务一起丢弃。
+        """
+        with self._lock:
+            needs_save = needs_save or self._transaction_needs_save
+            self._transaction_records = None
+            self._transaction_needs_save = False
+            self.contacts = list(saved)
+            self._snapshot_ref = None
+            self.rebuild_phone_index()
+            self.mark_dirty()
+            if needs_save and self.save_interval is not None:
+                self._schedule_flush()
+        logger.warning("Transaction rolled back, no changes were written")
+    
+    def _schedule_flush(self) -> None:
+        """安排一次后台写入，距上次写盘不足一个间隔时延后执行"""
+        with self._lock:
+            if self._save_timer is not None:
+                return
+            delay = max(0.0, self._last_flush + self.save_interval - time.monotonic())
+            self._save_timer = threading.Timer(delay, self._flush_in_background)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+    
+    def _flush_in_background(self) -> None:
+        """定时器线程：执行合并后的写入"""
+        try:
+            self.flush()
+        except Exception as e:
+            # 写入失败时数据仍在内存中并保持脏标记，下次写入会重试
+            logger.error(f"Background save failed: {e}", exc_info=True)
+    
+    def has_pending_writes(self) -> bool:
+        """是否有尚未写入磁盘的合并修改"""
+        return bool(self._pending_records) or self._save_timer is not None
+    
+    def flush(self) -> None:
+        """立即写入所有合并中的修改"""
+        with self._flush_lock:
+            with self._lock:
+                if self._save_timer is not None:
+                    self._save_timer.cancel()
+                    self._save_timer = None
+                records = self._pending_records
+                self._pending_records = []
+                self._last_flush = time.monotonic()
+            
+            if self.use_journal:
+                if records:
+                    try:
+                        self._append_journal(records)
+                    except Exception:
+                        # 保留记录，等待下次写入重试
+                        with self._lock:
+                            self._pending_records[:0] = records
+                        raise
+                    self._maybe_compact()
+            else:
+                self.save_contacts()
+    
+    def close(self) -> None:
+        """写入合并中的修改和最终快照，程序退出前调用"""
+        self.flush()
+        self.save_contacts()
+        self.wait_for_compaction()
+        # 已全部写入，进程退出时无需再次写入，也不再持有对本对象的引用
+        atexit.unregister(self.flush)
+    
+    def _journal_size(self) -> int:
+        """当前日志文件的字节数"""
+        try:
+            return os.path.getsize(self.journal_path)
+        except OSError:
+            return 0
+    
+    def _maybe_compact(self) -> None:
+        """日志超过大小或时间阈值时触发后台压缩；事务进行中时推迟到提交后"""
+        if self._transaction_records is not None:
+            return
+        size = self._journal_size()
+        if size == 0:
+            return
+        age = time.monotonic() - self._last_checkpoint
+        if size >= self.compact_threshold_bytes or age >= self.compact_max_age:
+            self.compact()
+    
+    def is_compacting(self) -> bool:
+        """是否有后台压缩正在进行"""
+        thread = self._compaction_thread
+        return thread is not None and thread.is_alive()
+    
+    def wait_for_compaction(self, timeout: Optional[float] = None) -> None:
+        """等待进行中的后台压缩结束"""
+        thread = self._compaction_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+    
+    def compact(self, wait: bool = False) -> bool:
+        """在后台线程中生成新快照并清理已合并的日志
+
+        先在锁内轮转日志并复制联系人列表（只复制引用），之后的修改写入新日志，
+        序列化和写盘都在后台线程完成，不阻塞界面和后续修改。
+        事务进行中时内存包含尚未提交的修改，不能写入快照，此时不压缩。
+        返回是否启动了新的压缩。
+        """
+        with self._lock:
+            if self._transaction_records is not None:
+                logger.debug("Transaction in progress, deferring compaction")
+                return False
+            if self.is_compacting() or not os.path.exists(self.journal_path):
+                return False
+            
+            try:
+                if os.path.exists(self.compacting_journal_path):
+                    # 上次压缩未完成，把当前日志并入旧日志，保证重放顺序
+                    with open(self.journal_path, "r", encoding="utf-8") as src, \
+                            open(self.compacting_journal_path, "a", encoding="utf-8") as dst:
+                        dst.write(src.read())
+                    os.remove(self.journal_path)
+                else:
+                    os.replace(self.journal_path, self.compacting_journal_path)
+            except OSError as e:
+                logger.error(f"Failed to rotate journal {self.journal_path}: {e}")
+                return False
+            
+            snapshot = self.snapshot()
+            self._last_checkpoint = time.monotonic()
+            self._compaction_thread = threading.Thread(
+                target=self._run_compaction, args=(snapshot, self._generation),
+                name="contacts-compaction", daemon=True
+            )
+            self._compaction_thread.start()
+        
+        if wait:
+            self.wait_for_compaction()
+        return True
+    
+    def _run_compaction(self, snapshot: ContactsView, generation: int) -> None:
+        """后台线程：写入新快照并删除已合并的日志"""
+        start = time.perf_counter()
+        temp_file_path = f"{self.file_path}.compact.tmp"
+        try:
+            size_before = sum(
+                os.path.getsize(path) for path in (self.file_path, self.compacting_journal_path)
+                if os.path.exists(path)
+            )
+            
+            text, digest = self._serialize(snapshot)
+            self._write_snapshot(text, temp_file_path, digest)
+            with self._lock:
+                os.remove(self.compacting_journal_path)
+                self._mark_clean(digest, generation, len(snapshot))
+            
+            size_after = os.path.getsize(self.file_path)
+            duration = time.perf_counter() - start
+            self.last_compaction_stats = {
+                "duration": duration,
+                "reclaimed_bytes": size_before - size_after,
+                "snapshot_bytes": size_after,
+                "contacts": len(snapshot),
+            }
+            logger.info(f"Compacted {len(snapshot)} contacts into {self.file_path} in {duration:.3f}s, "
+                        f"reclaimed {size_before - size_after} bytes")
+        except Exception as e:
+            # 旧日志保留在磁盘上，下次加载时仍会重放，不会丢失数据
+            logger.error(f"Background compaction failed: {e}", exc_info=True)
+            if os.path.exists(temp_file_path):
+                try:
+                    os.remove(temp_file_path)
+                except OSError:
+                    pass
+    
+    def _replay_journals(self) -> None:
+        """按写入顺序重放正在压缩的旧日志和当前日志"""
+        for path in (self.compacting_journal_path, self.journal_path):
+            self._replay_journal(path)
+    
+    def _replay_journal(self, journal_path: str) -> None:
+        """在已加载的快照之上重放日志记录
+
+        每条记录以联系人id为键，找不到id时退回按电话号码匹配（旧日志或id尚未写入快照）。
+        每条记录都把某个键设为确定的值，重放是幂等的：即使快照已经包含了部分记录，
+        重复应用后的结果仍然一致。
+        """
+        if not os.path.isfile(journal_path):
+            return
+        
+        try:
+            with open(journal_path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except OSError as e:
+            logger.error(f"OS error when reading {journal_path}: {e}")
+            raise OSError(f"Failed to read file {journal_path}: {e}")
+        
+        # 使用带空位的列表保持原有顺序，删除时置为None，最后统一压缩
+        items: List[Optional[Contact]] = list(self.contacts)
+        by_id: Dict[str, int] = {contact.id: i for i, contact in enumerate(items)}
+        by_phone: Dict[str, int] = {contact.phone: i for i, contact in enumerate(items)}
+        applied_count = 0
+        skipped_count = 0
+        
+        def find(contact_id: Optional[str], phone: Optional[str]) -> Optional[int]:
+            index = by_id.get(contact_id) if contact_id is not None else None
+            if index is None and phone is not None:
+                index = by_phone.get(phone)
+            return index
+        
+        def remove(index: int) -> None:
+            old = items[index]
+            items[index] = None
+            if by_id.get(old.id) == index:
+                del by_id[old.id]
+            if by_phone.get(old.phone) == index:
+                del by_phone[old.phone]
+        
+        def put(index: Optional[int], contact: Contact) -> None:
+            if index is None:
+                index = len(items)
+                items.append(contact)
+            else:
+                remove(index)
+                items[index] = contact
+            by_id[contact.id] = index
+            by_phone[contact.phone] = index
+        
+        def apply(record: Dict[str, Any]) -> None:
+            op = record["op"]
+            if op == "add":
+                contact = Contact.from_dict(record["contact"])
+                put(find(contact.id, contact.phone), contact)
+            elif op == "update":
+                contact = Contact.from_dict(record["contact"])
+                index = find(record.get("id"), record.get("phone"))
+                if index is None:
+                    index = find(contact.id, contact.phone)
+                put(index, contact)
+            elif op == "delete":
+                index = find(record.get("id"), record.get("phone"))
+                if index is not None:
+                    remove(index)
+            elif op == "batch":
+                # 事务提交的一组修改写在同一行，整行写入不完整时一并跳过
+                for sub_record in record["records"]:
+                    apply(sub_record)
+            else:
+                raise ValueError(f"Unknown journal operation: {op}")
+        
+        for line_number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                apply(json.loads(line))
+                applied_count += 1
+            except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+                # 最后一行可能因意外退出而写入不完整，跳过即可
+                logger.warning(f"Skipping invalid journal record at line {line_number}: {e}")
+                skipped_count += 1
+        
+        self._detach_snapshot()
+        self.contacts[:] = [contact for contact in items if contact is not None]
+        if applied_count:
+            self.mark_dirty()
+        logger.info(f"Replayed {applied_count} journal records from {journal_path}"
+                    + (f", skipped {skipped_count} invalid records" if skipped_count else ""))
+    
+    def rebuild_phone_index(self) -> None:
+        """根据联系人列表重建电话号码索引；直接修改了contacts中的电话号码后需调用"""
+        with self._lock:
+            # 电话号码重复时与线性查找一致，返回列表中第一个联系人
+            self._phone_index = {contact.phone: contact for contact in reversed(self.contacts)}
+    
+    def _unindex_phone(self, contact: Contact) -> None:
+        """从电话号码索引中移除联系人（仅当索引项正指向该联系人时）"""
+        if self._phone_index.get(contact.phone) is contact:
+            del self._phone_index[contact.phone]
+    
+    def _after_undo(self) -> None:
+        """持久化失败并恢复联系人列表后调用：重建电话号码索引，递增代数使依赖代数的缓存失效"""
+        self.rebuild_phone_index()
+        self.mark_dirty()
+    
     def add_contact(self, contact: Contact) -> None:
-        """添加联系人"""
+        """添加联系人，写入失败时撤销添加并抛出异常"""
         if not isinstance(contact, Contact):
             raise TypeError("contact must be an instance of Contact")
-        self.contacts.append(contact)
-        self.save_contacts()
+        with self._lock:
+            self._detach_snapshot()
+            index = len(self.contacts)
+            self.contacts.append(contact)
+            self._phone_index.setdefault(contact.phone, contact)
+            self.mark_dirty()
+        try:
+            self._persist([{"op": "add", "contact": contact.to_dict()}])
+        except Exception:
+            with self._lock:
+                self._detach_snapshot()
+                del self.contacts[index]
+                self._after_undo()
+            raise
     
     def update_contact(self, index: int, contact: Contact) -> None:
-        """更新联系人"""
+        """更新联系人，写入失败时恢复原联系人并抛出异常"""
         if not isinstance(contact, Contact):
             raise TypeError("contact must be an instance of Contact")
         if not 0 <= index < len(self.contacts):
             raise IndexError("Invalid contact index")
-        self.contacts[index] = contact
-        self.save_contacts()
+        with self._lock:
+            old_contact = self.contacts[index]
+            old_id, old_phone = old_contact.id, old_contact.phone
+            self._unindex_phone(old_contact)
+            self._detach_snapshot()
+            self.contacts[index] = contact
+            self._phone_index.setdefault(contact.phone, contact)
+            self.mark_dirty()
+        try:
+            self._persist([{"op": "update", "id": old_id, "phone": old_phone, "contact": contact.to_dict()}])
+        except Exception:
+            with self._lock:
+                self._detach_snapshot()
+                self.contacts[index] = old_contact
+                self._after_undo()
+            raise
     
     def delete_contact(self, index: int) -> None:
-        """删除联系人"""
+        """删除联系人，写入失败时恢复该联系人并抛出异常"""
         if not 0 <= index < len(self.contacts):
             raise IndexError("Invalid contact index")
-        del self.contacts[index]
-        self.save_contacts()
+        with self._lock:
+            contact = self.contacts[index]
+            self._unindex_phone(contact)
+            self._detach_snapshot()
+            del self.contacts[index]
+            self.mark_dirty()
+        try:
+            self._persist([{"op": "delete", "id": contact.id, "phone": contact.phone}])
+        except Exception:
+            with self._lock:
+                self._detach_snapshot()
+                self.contacts.insert(index, contact)
+                self._after_undo()
+            raise
+    
+    def add_contacts(self, contacts: List[Contact]) -> None:
+        """批量添加联系人，只持久化一次；写入失败时整批撤销并抛出异常"""
+        for contact in contacts:
+            if not isinstance(contact, Contact):
+                raise TypeError("contact must be an instance of Contact")
+        if not contacts:
+            return
+        with self._lock:
+            self._detach_snapshot()
+            start = len(self.contacts)
+            self.contacts.extend(contacts)
+            for contact in contacts:
+                self._phone_index.setdefault(contact.phone, contact)
+            self.mark_dirty()
+        try:
+            self._persist([{"op": "add", "contact": contact.to_dict()} for contact in contacts])
+        except Exception:
+            with self._lock:
+                self._detach_snapshot()
+                del self.contacts[start:start + len(contacts)]
+                self._after_undo()
+            raise
+    
+    def update_contacts(self, updates: List[Tuple[int, Contact]]) -> None:
+        """批量更新联系人，updates为 (位置, 新联系人) 列表，只持久化一次；写入失败时整批撤销并抛出异常"""
+        for index, contact in updates:
+            if not isinstance(contact, Contact):
+                raise TypeError("contact must be an instance of Contact")
+            if not 0 <= index < len(self.contacts):
+                raise IndexError("Invalid contact index")
+        if not updates:
+            return
+        records = []
+        replaced: List[Tuple[int, Contact]] = []
+        with self._lock:
+            self._detach_snapshot()
+            for index, contact in updates:
+                old_contact = self.contacts[index]
+                self._unindex_phone(old_contact)
+                self.contacts[index] = contact
+                replaced.append((index, old_contact))
+                records.append({"op": "update", "id": old_contact.id, "phone": old_contact.phone,
+                                "contact": contact.to_dict()})
+            for _, contact in updates:
+                self._phone_index.setdefault(contact.phone, contact)
+            self.mark_dirty()
+        try:
+            self._persist(records)
+        except Exception:
+            with self._lock:
+                self._detach_snapshot()
+                # 倒序恢复，同一位置出现多次时还原为最早的联系人
+                for index, old_contact in reversed(replaced):
+                    self.contacts[index] = old_contact
+                self._after_undo()
+            raise
+    
+    def delete_contacts(self, indices: List[int]) -> None:
+        """批量删除联系人，只重建一次列表并持久化一次；写入失败时整批撤销并抛出异常"""
+        for index in indices:
+            if not 0 <= index < len(self.contacts):
+                raise IndexError("Invalid contact index")
+        removed = set(indices)
+        if not removed:
+            return
+        records = []
+        with self._lock:
+            for index in sorted(removed):
+                contact = self.contacts[index]
+                self._unindex_phone(contact)
+                records.append({"op": "delete", "id": contact.id, "phone": contact.phone})
+            previous = self.contacts
+            # 直接换用新列表，已发出的快照不受影响
+            self.contacts = [contact for index, contact in enumerate(self.contacts) if index not in removed]
+            self._snapshot_ref = None
+            self.mark_dirty()
+        try:
+            self._persist(records)
+        except Exception:
+            with self._lock:
+                # 原列表可能仍被快照引用，恢复为副本
+                self.contacts = list(previous)
+                self._snapshot_ref = None
+                self._after_undo()
+            raise
     
     def get_contact_by_phone(self, phone: str) -> Optional[Contact]:
         """根据电话号码查找联系人"""
         if not isinstance(phone, str):
             raise TypeError("phone must be a string")
-        for contact in self.contacts:
-            if contact.phone == phone:
-                return contact
-        return None
+        return self._phone_index.get(phone)
     
     def clear_contacts(self) -> None:
         """清空所有联系人"""
-        self.contacts.clear()
+        with self._lock:
+            self.contacts = []
+            self._snapshot_ref = None
+            self._phone_index.clear()
+            self.mark_dirty()
         self.save_contacts()
     
     def get_contacts_count(self) -> int:
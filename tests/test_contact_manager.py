@@ -0,0 +1,231 @@
+import pytest
+
+from contact import Contact
+from contact_manager import ContactManager
+from query import INTERSECT_FACTOR, QuerySyntaxError, parse_query
+from storage import DataStorage
+
+
+def make_contact(name: str, phone: str) -> Contact:
+    return Contact(name, phone, f"{name.lower()}@example.com")
+
+
+def make_manager(tmp_path, count: int = 5) -> ContactManager:
+    storage = DataStorage(str(tmp_path / "contacts.json"))
+    manager = ContactManager(storage)
+    manager.add_contacts([make_contact("Person" + chr(ord('a') + i), f"1380000000{i}") for i in range(count)])
+    return manager
+
+
+def test_id_operations_locate_contacts_after_deletes(tmp_path):
+    manager = make_manager(tmp_path)
+    ids = [contact.id for contact in manager.get_all_contacts()]
+
+    assert manager.delete_contact_by_id(ids[1])[0]
+    assert manager.toggle_frequent(ids[3])[0]
+    assert manager.update_contact_by_id(ids[4], make_contact("Renamed", "13900000004"))[0]
+    assert manager.delete_contact_by_id(ids[0])[0]
+
+    assert [(contact.id, contact.name, contact.is_frequent) for contact in manager.get_all_contacts()] == [
+        (ids[2], "Personc", False), (ids[3], "Persond", True), (ids[4], "Renamed", False)
+    ]
+
+
+class NoScanList(list):
+    """禁止遍历和线性查找的列表，用于确认按id定位联系人时不扫描存储列表"""
+
+    def __iter__(self):
+        raise AssertionError("scan of storage contacts")
+
+    def index(self, *args):
+        raise AssertionError("scan of storage contacts")
+
+
+def test_id_operations_locate_contacts_without_scanning(tmp_path):
+    # 日志模式下单次修改只写入一条记录，不会遍历联系人列表
+    storage = DataStorage(str(tmp_path / "contacts.json"), use_journal=True)
+    manager = ContactManager(storage)
+    manager.add_contacts([make_contact("Person" + chr(ord('a') + i), f"1380000000{i}") for i in range(8)])
+    ids = [contact.id for contact in storage.contacts]
+    storage.contacts = NoScanList(storage.contacts)
+
+    # 删除开头和中间的联系人后，其后的位置整体前移
+    assert manager.delete_contact_by_id(ids[0])[0]
+    assert manager.delete_contact_by_id(ids[4])[0]
+    assert manager.toggle_frequent(ids[7])[0]
+    assert manager.update_contact_by_id(ids[5], make_contact("Renamed", "13900000005"))[0]
+    assert manager.delete_contact_by_id(ids[2])[0]
+    assert manager.add_contact(make_contact("Added", "13900000009"))[0]
+    assert manager.delete_contact_by_id(ids[1])[0]
+    assert manager.delete_contact_by_id(ids[3])[0]
+
+    assert [(contact.name, contact.is_frequent) for contact in list.__iter__(storage.contacts)] == [
+        ("Renamed", False), ("Persong", False), ("Personh", True), ("Added", False)
+    ]
+
+
+def test_query_cache_invalidated_by_direct_storage_changes(tmp_path):
+    manager = make_manager(tmp_path)
+    contact_id = manager.get_all_contacts()[0].id
+    assert len(manager.search_by_name("person")) == 5
+    assert len(manager.search_by_name("person")) == 5
+    assert manager.get_query_cache_stats()["hits"] == 1
+
+    manager.storage.clear_contacts()
+    assert manager.search_by_name("person") == []
+    assert manager.get_contact_by_id(contact_id) is None
+
+
+def test_manager_write_after_direct_storage_change_resyncs(tmp_path):
+    storage = DataStorage(str(tmp_path / "contacts.json"))
+    manager = ContactManager(storage)
+    manager.add_contact(make_contact("Alice", "13800000001"))
+    manager.add_contact(make_contact("Bob", "13800000002"))
+
+    storage.clear_contacts()
+    assert manager.add_contact(make_contact("Carol", "13800000003"))[0]
+
+    assert [contact.name for contact in manager.search_by_name("o")] == ["Carol"]
+    assert [contact.name for contact in manager.unified_search("a")] == ["Carol"]
+
+
+QUERY_ROWS = [
+    ("Li Wei", "13800000000", "liwei@qq.com", True),
+    ("Li Na", "13800000001", "lina@163.com", False),
+    ("Wang Fang", "13800000002", "wf@qq.com", False),
+    ("Ann Nna", "13800000003", "", False),
+    ("Anna Zhang", "13800000004", "anna@gmail.com", False),
+    ("Zhao Lei", "13800000005", "zl@163.com", False),
+    ("Chen Jie", "13800000006", "", False),
+    ("Liu Yang", "13800000007", "ly@gmail.com", False),
+    ("Bob Smith", "+15550000001", "bob@qq.com", False),
+    ("Emma Brown", "+15550000002", "emma@gmail.com", False),
+    ("Olivia Li", "+445550000003", "olivia@qq.com", False),
+]
+
+
+def make_query_manager(tmp_path) -> ContactManager:
+    manager = ContactManager(DataStorage(str(tmp_path / "contacts.json")))
+    manager.add_contacts([Contact(name, phone, email, "", frequent) for name, phone, email, frequent in QUERY_ROWS])
+    return manager
+
+
+def query_names(manager: ContactManager, query: str) -> list:
+    return [contact.name for contact in manager.query(query)]
+
+
+def test_parse_query_quotes_exact_match_and_bare_words():
+    predicates = parse_query('name:"Li Wei" email:=Bob@QQ.com frequent:yes smith')
+    assert [(p.field, p.value, p.exact) for p in predicates] == [
+        ("name", "li wei", False), ("email", "bob@qq.com", True), ("frequent", True, False), ("any", "smith", False)
+    ]
+    assert str(predicates[0]) == 'name:"li wei"'
+
+
+@pytest.mark.parametrize("query", ['name:"li wei', "frequent:maybe", "keypad:abc", "name:", "email:="])
+def test_parse_query_rejects_invalid_syntax(query):
+    with pytest.raises(QuerySyntaxError):
+        parse_query(query)
+
+
+def test_query_exact_and_substring_match(tmp_path):
+    manager = make_query_manager(tmp_path)
+    assert query_names(manager, 'name:"li wei"') == ["Li Wei"]
+    assert query_names(manager, "name:=li") == []
+    assert query_names(manager, 'name:="olivia li"') == ["Olivia Li"]
+    assert query_names(manager, "email:=bob@qq.com") == ["Bob Smith"]
+
+
+def test_query_rechecks_non_exact_indexes(tmp_path):
+    manager = make_query_manager(tmp_path)
+    # "Ann Nna" 含有 anna 的全部三元组，n-gram索引会把它作为候选，复核子串后排除
+    plan = manager.plan_query("name:anna")
+    assert plan.index_steps[0].index.name == "name_ngram" and plan.index_steps[0].estimate == 2
+    assert query_names(manager, "name:anna") == ["Anna Zhang"]
+
+
+def test_query_applies_residual_filters(tmp_path):
+    manager = make_query_manager(tmp_path)
+    plan = manager.plan_query("country:中国 any:qq")
+    assert [step.index.name for step in plan.index_steps] == ["country"]
+    assert [str(predicate) for predicate in plan.filters] == ["any:qq"]
+    assert query_names(manager, "country:中国 any:qq") == ["Li Wei", "Wang Fang"]
+
+
+def test_query_planner_intersects_or_filters_by_selectivity(tmp_path):
+    manager = make_query_manager(tmp_path)
+
+    # 估计行数相近的索引求交
+    plan = manager.plan_query("email:@qq.com country:美国/加拿大")
+    assert [(step.index.name, step.estimate) for step in plan.index_steps] == [("country", 2), ("email_domain", 4)]
+    assert query_names(manager, "email:@qq.com country:美国/加拿大") == ["Bob Smith"]
+
+    # 后一个索引的估计行数超过首个索引的INTERSECT_FACTOR倍时改为逐个检查
+    plan = manager.plan_query("country:中国 frequent:yes")
+    assert 8 > 1 * INTERSECT_FACTOR
+    assert [step.index.name for step in plan.index_steps] == ["frequent"]
+    assert [(step.index.name, step.estimate) for step in plan.filter_steps] == [("country", 8)]
+    assert query_names(manager, "country:中国 frequent:yes") == ["Li Wei"]
+
+
+def test_explain_multi_index_query(tmp_path):
+    manager = make_query_manager(tmp_path)
+    assert manager.explain("country:美国/加拿大 email:@qq.com name:li").splitlines() == [
+        "查询: country:美国/加拿大 email:@qq.com name:li",
+        "联系人总数: 11",
+        "索引扫描: country:美国/加拿大 使用 country（估计 2 行）",
+        "索引求交: email:@qq.com 使用 email_domain（估计 4 行，需复核）",
+        "过滤: name:li",
+        "估计结果: 1 行",
+    ]
+
+
+def test_search_fuzzy_tolerates_typos(tmp_path):
+    manager = make_query_manager(tmp_path)
+    assert [contact.name for contact in manager.search_fuzzy("smiht")] == ["Bob Smith"]
+    assert manager.search_fuzzy("smiht", max_distance=0) == []
+    assert [contact.name for contact in manager.search_fuzzy("smith", max_distance=0)] == ["Bob Smith"]
+
+
+def test_search_fuzzy_combines_distances_across_words(tmp_path):
+    manager = make_query_manager(tmp_path)
+    manager.add_contacts([Contact("Rob Smith", "13900000001"), Contact("Bob Jones", "13900000002")])
+    # 每个词都须匹配；Bob Smith 距离和为1，Rob Smith 为2，Bob Jones 的 smiht 不匹配
+    assert [contact.name for contact in manager.search_fuzzy("bob smiht")] == ["Bob Smith", "Rob Smith"]
+
+
+def test_search_fuzzy_sees_changes_after_index_is_built(tmp_path):
+    manager = make_query_manager(tmp_path)
+    assert manager.search_fuzzy("smyth") == [manager.storage.contacts[8]]
+
+    assert manager.add_contact(Contact("Jane Smyth", "13900000003"))[0]
+    assert [contact.name for contact in manager.search_fuzzy("smyth", max_distance=0)] == ["Jane Smyth"]
+    bob_id = manager.storage.contacts[8].id
+    assert manager.update_contact_by_id(bob_id, Contact("Bob Smithers", "+15550000001"))[0]
+    assert [contact.name for contact in manager.search_fuzzy("smith", max_distance=1)] == ["Jane Smyth"]
+
+
+def keypad_names(manager: ContactManager, code: str) -> list:
+    return sorted(contact.name for contact in manager.search_by_keypad(code))
+
+
+def test_search_by_keypad_matches_chinese_names_by_pinyin(tmp_path):
+    storage = DataStorage(str(tmp_path / "contacts.json"))
+    manager = ContactManager(storage)
+    manager.add_contacts([Contact("张明", "13800000001"), Contact("李娜", "13800000002"),
+                          Contact("曾丽", "13800000003"), Contact("单丹", "13800000004")])
+
+    # 张明：全拼 zhang ming = 94264 6464，首字母 zm = 96
+    assert keypad_names(manager, "94") == ["张明"]
+    assert keypad_names(manager, "96") == ["张明"]
+    assert keypad_names(manager, "9426") == ["张明"]
+    assert keypad_names(manager, "942646464") == ["张明"]
+    # 从第二个字开始的词首匹配
+    assert keypad_names(manager, "6464") == ["张明"]
+    # 姓氏读音：曾 -> zeng（不是 ceng），单 -> shan（不是 dan）
+    assert keypad_names(manager, "9364") == ["曾丽"]
+    assert keypad_names(manager, "95") == ["曾丽"]
+    assert keypad_names(manager, "2364") == []
+    assert keypad_names(manager, "7426") == ["单丹"]
+    # 名字中的“丹”按普通读音 dan
+    assert keypad_names(manager, "326") == ["单丹"]
@@ -0,0 +1,64 @@
+import pytest
+
+from search_index import FuzzyIndex, KeypadIndex, edit_distance
+
+
+def test_keypad_index_remove_targets_key_among_shared_codes():
+    index = KeypadIndex()
+    index.rebuild((f"k{i:03d}", ("96", f"96{i % 10}")) for i in range(100))
+    index.remove("k042", ("96", "962"))
+    index.add("a500", ("96",))
+
+    lo, hi = index.prefix_range("96")
+    keys = index.keys_in_range(lo, hi)
+    assert "k042" not in keys and "a500" in keys
+    assert len(index) == 199
+    assert index.keys_in_range(*index.prefix_range("962")) == {f"k{i:03d}" for i in range(2, 100, 10)} - {"k042"}
+    # 增量维护后记录仍按 (序列, 键) 有序，与全量重建一致
+    assert list(zip(index._codes, index._keys)) == sorted(zip(index._codes, index._keys))
+
+
+def test_keypad_index_remove_ignores_missing_entries():
+    index = KeypadIndex()
+    index.add("a", ("5",))
+    index.remove("b", ("5",))
+    index.remove("a", ("6",))
+    assert index.keys_in_range(*index.prefix_range("5")) == {"a"}
+
+
+@pytest.mark.parametrize("a, b, distance", [
+    ("smith", "smith", 0),
+    ("smiht", "smith", 1),
+    ("abc", "acb", 1),
+    ("smth", "smith", 1),
+    ("kitten", "sitting", 3),
+    ("", "abc", 3),
+])
+def test_edit_distance_counts_adjacent_swaps_as_one_edit(a, b, distance):
+    assert edit_distance(a, b) == distance
+    assert edit_distance(b, a) == distance
+
+
+def test_fuzzy_lookup_respects_distance_cutoff():
+    index = FuzzyIndex(max_distance=2)
+    index.rebuild([("1", "bob smith"), ("2", "emma brown")])
+    assert index.lookup("smiht", 1) == {"smith": 1}
+    assert index.lookup("smiht", 0) == {}
+    assert index.lookup("smxtx", 1) == {}
+    assert index.lookup("smxtx", 2) == {"smith": 2}
+    with pytest.raises(ValueError):
+        index.lookup("smith", 3)
+
+
+def test_fuzzy_index_incremental_add_and_remove():
+    index = FuzzyIndex(max_distance=1)
+    index.rebuild([("1", "bob smith"), ("2", "rob smith")])
+    index.add("3", "ann smyth")
+    assert index.search("smith", 1) == {"1": 0, "2": 0, "3": 1}
+
+    index.remove("1", "bob smith")
+    assert index.search("smith", 1) == {"2": 0, "3": 1}
+    index.remove("2", "rob smith")
+    # 最后一个包含smith的键移除后，该词的删除变体也被撤销
+    assert index.lookup("smith", 1) == {"smyth": 1}
+    assert index.search("bob", 1) == {}
@@ -0,0 +1,357 @@
+import json
+import time
+
+import pytest
+
+from contact import Contact
+from contact_manager import ContactManager
+from storage import DataStorage
+
+
+def make_contact(name: str, phone: str) -> Contact:
+    return Contact(name, phone, f"{name.lower()}@example.com")
+
+
+def names_on_disk(path) -> list:
+    return [contact.name for contact in DataStorage(str(path)).contacts]
+
+
+def wait_until(predicate, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached in time")
+        time.sleep(0.01)
+
+
+def failing_journal(storage, monkeypatch):
+    def fail(records):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(storage, "_append_journal", fail)
+
+
+def test_compaction_is_deferred_during_transaction(tmp_path):
+    path = tmp_path / "contacts.json"
+    storage = DataStorage(str(path), use_journal=True, save_interval=0.05, compact_max_age=0.01)
+    manager = ContactManager(storage)
+    manager.add_contact(make_contact("Before", "13800000001"))
+    storage.flush()
+    assert storage.compact(wait=True)
+    manager.add_contact(make_contact("Pending", "13800000002"))
+    storage.flush()
+
+    with pytest.raises(RuntimeError):
+        with manager.transaction():
+            manager.add_contact(make_contact("Uncommitted", "13800000003"))
+            time.sleep(0.05)
+            assert not storage.compact(wait=True)
+            # 定时器写入合并中的修改，但不能把未提交的联系人压缩进快照
+            storage.flush()
+            storage.wait_for_compaction()
+            raise RuntimeError("abort")
+
+    assert [contact.name for contact in storage.contacts] == ["Before", "Pending"]
+    assert names_on_disk(path) == ["Before", "Pending"]
+    with open(path, encoding="utf-8") as f:
+        assert "Uncommitted" not in f.read()
+    storage.close()
+
+
+def test_compaction_runs_after_commit(tmp_path):
+    path = tmp_path / "contacts.json"
+    storage = DataStorage(str(path), use_journal=True, compact_max_age=0.01)
+    manager = ContactManager(storage)
+    manager.add_contact(make_contact("Before", "13800000001"))
+    storage.wait_for_compaction()
+
+    with manager.transaction():
+        manager.add_contact(make_contact("First", "13800000002"))
+        manager.add_contact(make_contact("Second", "13800000003"))
+        time.sleep(0.02)
+    storage.wait_for_compaction()
+
+    with open(path, encoding="utf-8") as f:
+        assert [item["name"] for item in json.load(f)] == ["Before", "First", "Second"]
+    storage.close()
+
+
+def test_background_flush_during_rollback_is_rescheduled(tmp_path):
+    path = tmp_path / "contacts.json"
+    storage = DataStorage(str(path), save_interval=0.05)
+    manager = ContactManager(storage)
+    manager.add_contact(make_contact("Before", "13800000001"))
+    storage.flush()
+    manager.add_contact(make_contact("Committed", "13800000002"))
+    assert storage.has_pending_writes()
+
+    with pytest.raises(RuntimeError):
+        with manager.transaction():
+            manager.add_contact(make_contact("Uncommitted", "13800000003"))
+            # 定时器在事务中触发，保存被推迟
+            wait_until(lambda: storage._transaction_needs_save)
+            raise RuntimeError("abort")
+
+    assert [contact.name for contact in storage.contacts] == ["Before", "Committed"]
+    assert storage.has_pending_writes()
+    wait_until(lambda: not storage.has_pending_writes() and not storage.is_dirty())
+    assert names_on_disk(path) == ["Before", "Committed"]
+    storage.close()
+
+
+def test_failed_commit_restores_contacts(tmp_path, monkeypatch):
+    path = tmp_path / "contacts.json"
+    storage = DataStorage(str(path), use_journal=True)
+    manager = ContactManager(storage)
+    manager.add_contact(make_contact("Before", "13800000001"))
+
+    failing_journal(storage, monkeypatch)
+    with pytest.raises(OSError):
+        with manager.transaction():
+            manager.add_contact(make_contact("First", "13800000002"))
+            manager.add_contact(make_contact("Second", "13800000003"))
+
+    assert [contact.name for contact in storage.contacts] == ["Before"]
+    assert storage.get_contact_by_phone("13800000002") is None
+    assert manager.search_by_name("first") == []
+    monkeypatch.undo()
+    storage.close()
+    assert names_on_disk(path) == ["Before"]
+
+
+
+def test_failed_add_leaves_storage_and_cache_consistent(tmp_path, monkeypatch):
+    path = tmp_path / "contacts.json"
+    storage = DataStorage(str(path), use_journal=True)
+    manager = ContactManager(storage)
+    manager.add_contact(make_contact("Before", "13800000001"))
+
+    failing_journal(storage, monkeypatch)
+    success, _ = manager.add_contact(make_contact("Failed", "13800000002"))
+    assert not success
+    assert [contact.name for contact in storage.contacts] == ["Before"]
+    assert storage.get_contact_by_phone("13800000002") is None
+
+    monkeypatch.undo()
+    success, _ = manager.add_contact(make_contact("Retried", "13800000002"))
+    assert success
+    assert [contact.name for contact in manager.search_by_name("retried")] == ["Retried"]
+    storage.close()
+    assert names_on_disk(path) == ["Before", "Retried"]
+
+
+def test_failed_update_and_delete_are_undone(tmp_path, monkeypatch):
+    path = tmp_path / "contacts.json"
+    storage = DataStorage(str(path), use_journal=True)
+    manager = ContactManager(storage)
+    manager.add_contact(make_contact("Alice", "13800000001"))
+    manager.add_contact(make_contact("Bob", "13800000002"))
+    alice_id = storage.contacts[0].id
+
+    failing_journal(storage, monkeypatch)
+    success, _ = manager.update_contact_by_id(alice_id, make_contact("Alicia", "13800000003"))
+    assert not success
+    assert [contact.name for contact in storage.contacts] == ["Alice", "Bob"]
+    assert storage.get_contact_by_phone("13800000001") is storage.contacts[0]
+    assert storage.get_contact_by_phone("13800000003") is None
+
+    success, _ = manager.delete_contact_by_id(alice_id)
+    assert not success
+    assert [contact.name for contact in storage.contacts] == ["Alice", "Bob"]
+    assert manager.get_contact_by_id(alice_id) is storage.contacts[0]
+
+    monkeypatch.undo()
+    storage.close()
+    assert names_on_disk(path) == ["Alice", "Bob"]
+
+
+def test_failed_bulk_changes_are_rolled_back(tmp_path, monkeypatch):
+    path = tmp_path / "contacts.json"
+    storage = DataStorage(str(path), use_journal=True)
+    manager = ContactManager(storage)
+    manager.add_contacts([make_contact("Alice", "13800000001"), make_contact("Bob", "13800000002")])
+    alice_id, bob_id = (contact.id for contact in storage.contacts)
+
+    failing_journal(storage, monkeypatch)
+    results = manager.add_contacts([make_contact("Carol", "13800000003"),
+                                    make_contact("Dave", "13800000005")])
+    assert [success for success, _ in results] == [False, False]
+    assert [contact.name for contact in storage.contacts] == ["Alice", "Bob"]
+    assert storage.get_contact_by_phone("13800000003") is None
+
+    results = manager.update_many([(alice_id, make_contact("Alicia", "13800000004")),
+                                   (bob_id, make_contact("Robert", "13800000002"))])
+    assert [success for success, _ in results] == [False, False]
+    assert [contact.name for contact in storage.contacts] == ["Alice", "Bob"]
+    assert storage.get_contact_by_phone("13800000001").name == "Alice"
+
+    results = manager.delete_many([alice_id, bob_id])
+    assert [success for success, _ in results] == [False, False]
+    assert [contact.name for contact in manager.get_all_contacts()] == ["Alice", "Bob"]
+
+    monkeypatch.undo()
+    storage.close()
+    assert names_on_disk(path) == ["Alice", "Bob"]
+
+
+@pytest.mark.parametrize("use_journal", [False, True])
+def test_rolled_back_transaction_never_reaches_disk(tmp_path, use_journal):
+    path = tmp_path / "contacts.json"
+    storage = DataStorage(str(path), use_journal=use_journal)
+    manager = ContactManager(storage)
+    manager.add_contact(make_contact("Before", "13800000001"))
+    before_id = storage.contacts[0].id
+
+    with pytest.raises(RuntimeError):
+        with manager.transaction():
+            manager.add_contact(make_contact("Added", "13800000002"))
+            manager.update_contact_by_id(before_id, make_contact("Renamed", "13800000001"))
+            raise RuntimeError("abort")
+
+    assert names_on_disk(path) == ["Before"]
+    storage.close()
+    assert names_on_disk(path) == ["Before"]
+
+
+def test_committed_transaction_is_one_journal_record(tmp_path):
+    path = tmp_path / "contacts.json"
+    storage = DataStorage(str(path), use_journal=True)
+    manager = ContactManager(storage)
+    with manager.transaction():
+        manager.add_contact(make_contact("First", "13800000001"))
+        manager.add_contact(make_contact("Second", "13800000002"))
+
+    with open(storage.journal_path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 1 and json.loads(lines[0])["op"] == "batch"
+    assert names_on_disk(path) == ["First", "Second"]
+
+
+def test_replay_skips_torn_batch_line(tmp_path):
+    path = tmp_path / "contacts.json"
+    storage = DataStorage(str(path), use_journal=True)
+    manager = ContactManager(storage)
+    manager.add_contact(make_contact("Before", "13800000001"))
+    with manager.transaction():
+        manager.add_contact(make_contact("First", "13800000002"))
+        manager.add_contact(make_contact("Second", "13800000003"))
+
+    # 模拟写入批次记录时意外退出：最后一行只写入了一半
+    with open(storage.journal_path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    with open(storage.journal_path, "w", encoding="utf-8") as f:
+        f.write(lines[0] + "\n" + lines[1][:len(lines[1]) // 2])
+
+    assert names_on_disk(path) == ["Before"]
+
+
+def test_journal_replay_restores_unsaved_changes(tmp_path):
+    path = tmp_path / "contacts.json"
+    storage = DataStorage(str(path), use_journal=True)
+    manager = ContactManager(storage)
+    manager.add_contacts([make_contact("Alice", "13800000001"), make_contact("Bob", "13800000002"),
+                          make_contact("Carol", "13800000003")])
+    alice_id, bob_id, _ = (contact.id for contact in storage.contacts)
+    manager.update_contact_by_id(alice_id, make_contact("Alicia", "13800000004"))
+    manager.delete_contact_by_id(bob_id)
+
+    reloaded = DataStorage(str(path))
+    assert [(contact.name, contact.phone) for contact in reloaded.contacts] == [
+        ("Alicia", "13800000004"), ("Carol", "13800000003")
+    ]
+    assert reloaded.contacts[0].id == alice_id
+
+
+def test_background_compaction_merges_journal(tmp_path):
+    path = tmp_path / "contacts.json"
+    storage = DataStorage(str(path), use_journal=True, compact_threshold_bytes=1)
+    manager = ContactManager(storage)
+    manager.add_contact(make_contact("Alice", "13800000001"))
+    storage.wait_for_compaction()
+    manager.add_contact(make_contact("Bob", "13800000002"))
+    storage.wait_for_compaction()
+
+    assert storage.last_compaction_stats is not None
+    with open(path, encoding="utf-8") as f:
+        assert [item["name"] for item in json.load(f)] == ["Alice", "Bob"]
+    assert names_on_disk(path) == ["Alice", "Bob"]
+    storage.close()
+
+
+def test_save_interval_flushes_in_background(tmp_path):
+    path = tmp_path / "contacts.json"
+    storage = DataStorage(str(path), save_interval=0.05)
+    manager = ContactManager(storage)
+    manager.add_contact(make_contact("Alice", "13800000001"))
+    manager.add_contact(make_contact("Bob", "13800000002"))
+
+    wait_until(lambda: not storage.has_pending_writes() and not storage.is_dirty())
+    assert names_on_disk(path) == ["Alice", "Bob"]
+    storage.close()
+
+
+def test_failed_write_does_not_force_reindex(tmp_path, monkeypatch):
+    storage = DataStorage(str(tmp_path / "contacts.json"), use_journal=True)
+    manager = ContactManager(storage)
+    manager.add_contact(make_contact("Alice", "13800000001"))
+    rebuilds = manager.cache_rebuild_count
+
+    failing_journal(storage, monkeypatch)
+    assert not manager.add_contact(make_contact("Bob", "13800000002"))[0]
+    assert not manager.delete_contact_by_id(storage.contacts[0].id)[0]
+    assert [contact.name for contact in manager.search_by_name("alice")] == ["Alice"]
+    assert manager.cache_rebuild_count == rebuilds
+
+
+def test_snapshot_with_matching_checksum_skips_validation(tmp_path, monkeypatch):
+    path = tmp_path / "contacts.json"
+    storage = DataStorage(str(path))
+    ContactManager(storage).add_contact(make_contact("Alice", "13800000001"))
+    storage.close()
+    assert (tmp_path / "contacts.json.sha256").exists()
+
+    def no_validation(data):
+        raise AssertionError("trusted snapshot was validated")
+
+    monkeypatch.setattr(Contact, "from_dict", no_validation)
+    reloaded = DataStorage(str(path))
+    assert [(contact.name, contact.country) for contact in reloaded.contacts] == [("Alice", "中国")]
+    assert not reloaded.is_dirty()
+
+
+def test_hand_edited_snapshot_is_validated(tmp_path, monkeypatch):
+    path = tmp_path / "contacts.json"
+    storage = DataStorage(str(path))
+    ContactManager(storage).add_contact(make_contact("Alice", "13800000001"))
+    storage.close()
+
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    data.append({"name": "Bad", "phone": "not a phone"})
+    data.append({"name": "Bob", "phone": "13800000002", "email": "bob@example.com"})
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+    def no_trust(data):
+        raise AssertionError("edited snapshot was trusted")
+
+    monkeypatch.setattr(Contact, "from_trusted_dict", no_trust)
+    reloaded = DataStorage(str(path))
+    assert [contact.name for contact in reloaded.contacts] == ["Alice", "Bob"]
+    # 丢弃了无效条目，保存时重写快照和校验和
+    assert reloaded.is_dirty()
+    reloaded.close()
+    monkeypatch.undo()
+    with open(path, encoding="utf-8") as f:
+        assert [item["name"] for item in json.load(f)] == ["Alice", "Bob"]
+
+
+def test_close_unregisters_exit_flush(tmp_path, monkeypatch):
+    registered = []
+    monkeypatch.setattr("storage.atexit.register", registered.append)
+    monkeypatch.setattr("storage.atexit.unregister", registered.remove)
+
+    storage = DataStorage(str(tmp_path / "contacts.json"), save_interval=0.05)
+    assert registered == [storage.flush]
+    storage.close()
+    assert registered == []